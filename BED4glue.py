@@ -3,14 +3,27 @@
 __doc__='''merges bookended BED entries with same name (input MUST be sorted to make this work)'''
 
 import sys
+from optparse import OptionParser
+from dcbio.misc import Parallel
 
-last = None
-for line in sys.stdin:
-    f = line.split()
-    if last and last[3] == f[3] and last[2] == f[1]:
-        last[2:4] = f[2:4]
-    else:
-        if last:
-            print '\t'.join(last)
-        last = f
-print '\t'.join(last)
+def glue(lines):
+    '''joins bookended BED lines with the same name'''
+    last = None
+    for line in lines:
+        f = line.split()
+        if last and last[3] == f[3] and last[2] == f[1]:
+            last[2:4] = f[2:4]
+        else:
+            if last:
+                yield '\t'.join(last) + '\n'
+            last = f
+    if last:
+        yield '\t'.join(last) + '\n'
+
+if __name__=="__main__":
+    parser = OptionParser(usage="%prog [options] < sorted.bed")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Process chromosomes in parallel [%default]")
+    parser.add_option("-k", "--karyotype", dest="karyotype", action="store_true", default=False, help="Output chromosomes in karyotype order")
+    (options, args) = parser.parse_args()
+
+    Parallel.run(glue, sys.stdin, sys.stdout, options.processes, options.karyotype)
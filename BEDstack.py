@@ -9,49 +9,71 @@ AAAAAAAAA
         CCC
 1---12-23-31-1  sum of scores (1 by default)
 AAAAADDDEFFBBB  where D=AB, E=ABC, F=DB
+
+with several BED files, writes the depth of every sample per elementary segment (TSV or NPZ matrix)
 '''
 
 import sys
+import os
 from collections import defaultdict
+from optparse import OptionParser
+from array import array
 import md5
 import dcbio.parse.BEDfile as BEDfile
+from dcbio.misc import Parallel
+
+def stack(lines):
+    '''stacked segments (with names and cumulative score) of BED lines'''
+    for s in BEDfile.mBEDstack(lines):
+        yield "\t".join(map(str,s)) + "\n"
+
+def sampleNames(files):
+    '''file names without extension (eg. a.rep1.bed -> a.rep1), duplicates are rejected'''
+    names = [ os.path.splitext(os.path.basename(f))[0] for f in files ]
+    for name in set(names):
+        if names.count(name) > 1:
+            raise Exception('sample name %s is not unique (%s)' % (name, ', '.join([ f for f, n in zip(files, names) if n == name ])))
+    return names
+
+def depthMatrix(files, natural=False, npz=None):
+    '''single pass over sorted BED files, writes TSV (stdout) or NPZ matrix'''
+    names = sampleNames(files)
+    fhs = [ open(f) for f in files ]
+    samples = [ BEDfile.iter_bed(fh, presorted=False, lazy=True) for fh in fhs ]
+    segments = BEDfile.depthSegments(samples, BEDfile.karyotypeKey if natural else None)
+    if npz:
+        import numpy as np
+        chroms, chromIds = [], {}
+        rows, starts, ends, depths = array('i'), array('l'), array('l'), array('l')
+        for chrom, start, end, depth in segments:
+            if chrom not in chromIds:
+                chromIds[chrom] = len(chroms)
+                chroms.append(chrom)
+            rows.append(chromIds[chrom])
+            starts.append(start)
+            ends.append(end)
+            depths.extend(depth)
+        np.savez(npz, samples=np.array(names), chroms=np.array(chroms), chrom=np.frombuffer(rows, dtype=np.int32),
+                 start=np.frombuffer(starts, dtype=np.int_), end=np.frombuffer(ends, dtype=np.int_),
+                 depth=np.frombuffer(depths, dtype=np.int_).reshape(-1, len(files)))
+    else:
+        print '\t'.join(['#chrom', 'start', 'end'] + names)
+        for chrom, start, end, depth in segments:
+            print '\t'.join([chrom, str(start), str(end)] + map(str, depth))
+    for fh in fhs:
+        fh.close()
+    return
 
 if __name__=="__main__":
-    e = None # chromosome buffer
-    for line in sys.stdin:
-        fields = line.split()
-        # check
-        try:
-            assert int(fields[1]) <= int(fields[2])
-        except:
-            print >> sys.stderr, fields
-            raise Exception("coordinate error (start bigger than end)")
-        # skip zero length
-        if int(fields[1]) == int(fields[2]):
-            continue
-        # build extensible BED instance (mBED)
-        f = mBED(fields)
-        if not e:
-            e = f
-        else:
-            # sorting check
-            try:
-                if e.chr == f.chr:
-                    assert e.chrStart <= f.chrStart
-            except AssertionError:
-                raise Exception("input has to be a sorted bed file")
-            # overlap and extend
-            if e._ovp(f):
-                # shift and print up to added position, add segments
-                for s in e._shift(f.chrStart):
-                    print "\t".join(map(str,s))
-                e._add(f)
-            else:
-                # print everthing and set new
-                for s in e._shift(e.chrEnd):
-                    print "\t".join(map(str,s))
-                e = f
-    # do last one
-    for s in e._shift(e.chrEnd):
-        print "\t".join(map(str,s))
+    parser = OptionParser(usage="%prog < sorted.bed | %prog [options] sample1.bed sample2.bed ...")
+    parser.add_option("-n", "--natural", dest="natural", action="store_true", default=False, help="Inputs are sorted in natural chromosome order (chr1, chr2, ..., chr10) instead of lexicographic")
+    parser.add_option("-z", "--npz", dest="npz", metavar="FILE", help="Write depth matrix to NumPy NPZ file instead of TSV")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Process chromosomes in parallel (stdin) [%default]")
+    parser.add_option("-k", "--karyotype", dest="karyotype", action="store_true", default=False, help="Output chromosomes in karyotype order (stdin)")
+    (options, args) = parser.parse_args()
+
+    if args:
+        depthMatrix(args, options.natural, options.npz)
+        sys.exit(0)
 
+    Parallel.run(stack, sys.stdin, sys.stdout, options.processes, options.karyotype)
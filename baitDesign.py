@@ -14,9 +14,12 @@ __email__ = "dbrawand@nhs.net"
 __status__ = "Development"  # ["Prototype", "Development",  "Production"]
 
 
+import os
 import sys
+import json
 from optparse import OptionParser
 from dcbio.parse.BEDfile import BED
+from dcbio.parse.BEDArray import cachedBED
 
 class Spec:
     def __init__(self,line):
@@ -88,6 +91,10 @@ class Spec:
     def __str__(self):
         return self.line
 
+    def key(self):
+        '''specification without its number (result cache key)'''
+        return self.line.split('\t', 1)[-1]
+
     def __repr__(self):
         reprData = [ self.geneName,
                     "UTR="+str(self.utr),
@@ -174,116 +181,106 @@ def readSynonyms(fi):
         del synonyms[a]
     return synonyms
 
-if __name__=="__main__":
-
-    usage = "usage: %prog [options] <ANNOTATION1> [ANNOTATION2] ..."
-    parser = OptionParser(usage=usage)
-    parser.add_option("-s", "--specs", dest="specs", metavar="FILE", help="Specification file (tab from excel)")
-    parser.add_option("-y", "--synonyms", dest="synonyms", metavar="FILE", help="synonyms (from UCSC gene_info")
-    (options, args) = parser.parse_args()
-
-    # read reference BED12 files
-    refs = []
+def readAnnotations(paths, cachedir=None):
+    '''reads reference BED12 files (through binary caches in cachedir), returns name indices'''
     refindex = []
-    for refFile in args:
+    for refFile in paths:
         print >> sys.stderr, "READING annotations from %s" % refFile
-        with open(refFile) as fh:
-            refs.append(BED(fh))
-            refindex.append(refs[-1].getDictList())
+        if cachedir:
+            ref = cachedBED(refFile, cachedir=cachedir)
+        else:
+            with open(refFile) as fh:
+                ref = BED(fh)
+        refindex.append(ref.getDictList())
         print >> sys.stderr, "READ gene annotations from %s" % refFile
-
-    # read synonyms
-    synonyms = {}
-    if options.synonyms:
-        print >> sys.stderr, "READING synonmyms"
-        synonyms = readSynonyms(options.synonyms)
-        print >> sys.stderr, "READ gene symbol synonyms"
-
-    # read specification
-    # number, gene, category, utr3, utr5, exonflanks, upstream, description
-    specs = readSpecs(options.specs)
-
-    # pick regions and output BED (covered regions)
-    for s in specs:
-        #print >> sys.stderr, "##### FETCH ##", s, '\r',
-        # skip the big regions
-        if s.region:
-            assert s.coordinates
+    return refindex
+
+def fingerprint(paths):
+    '''identifies input files by path, size and modification time'''
+    sources = []
+    for path in paths:
+        st = os.stat(path)
+        sources.append([ os.path.abspath(path), st.st_size, st.st_mtime ])
+    return sources
+
+def readResults(path, sources):
+    '''returns BED output per specification from a previous run (empty if inputs changed)'''
+    try:
+        with open(path) as fh:
+            cache = json.load(fh)
+    except (IOError, ValueError):
+        return {}
+    # strings are stored as latin-1 (any byte string round-trips)
+    if cache.get('encoding') != 'latin-1' or cache.get('sources') != json.loads(json.dumps(sources, encoding='latin-1')):
+        return {}
+    return dict((k.encode('latin-1'), v.encode('latin-1')) for k, v in cache.get('results', {}).iteritems())
+
+def writeResults(path, sources, results):
+    '''stores BED output per specification (warns if the cache cannot be written)'''
+    try:
+        with open(path + '.tmp', 'w') as fh:
+            json.dump({ 'encoding': 'latin-1', 'sources': sources, 'results': results }, fh, encoding='latin-1')
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError) as e:
+        print >> sys.stderr, "WARNING: cannot write result cache %s (%s)" % (path, e)
+    return
+
+def pickRegions(s, refindex, synonyms):
+    '''adds coordinates of specified gene (primary and secondary annotations)'''
+    # skip the big regions
+    if s.region:
+        assert s.coordinates
+    else:
+        # get gene info (primary and secondary)
+        genes = None
+        secondary = []
+
+        # check if gene symbol exists as such or as synonym
+        if s.geneName in refindex[0]:
+            queryname = s.geneName
         else:
-            # get gene info (primary and secondary)
-            genes = None
-            secondary = []
-
-            # check if gene symbol exists as such or as synonym
-            if s.geneName in refindex[0].keys():
-                queryname = s.geneName
+            try:
+                queryname = synonyms[s.geneName]
+            except KeyError:
+                print >> sys.stderr, "\n### NOT FOUND ###", str(s.geneName)
+                raise
             else:
-                try:
-                    queryname = synonyms[s.geneName]
-                except KeyError:
-                    print >> sys.stderr, "\n### NOT FOUND ###", str(s.geneName)
-                    raise
-                else:
-                    s.geneName += '|' + queryname
+                s.geneName += '|' + queryname
 
-            # select primary
-            genes = refindex[0][queryname]
-            # select secondary (no introns added)
-            for r in [ refindex[i] for i in s.secondary ]:
-                try:
-                    secondary += r[queryname]
-                except:
-                    pass
-
-            # fetch primary gene
+        # select primary
+        genes = refindex[0][queryname]
+        # select secondary (no introns added)
+        for r in [ refindex[i] for i in s.secondary ]:
             try:
-                assert genes
-            except AssertionError:
-                print >> sys.stderr, "\n### NOT FOUND ###", str(s)
-                #raise Exception("gene not found")
-            else:
-                for gene in genes:
-                    if s.introns:
-                        # full gene (plus flanks plus upstream)
-                        if s.utr:
-                            if gene.strand == "+":
-                                s.coordinates.append([ gene.chrom, gene.chromStart-s.upstream, gene.chromEnd, s.geneName ])
-                            elif gene.strand == "-":
-                                s.coordinates.append([ gene.chrom, gene.chromStart, gene.chromEnd+s.upstream, s.geneName ])
-                            else:
-                                raise Exception('Strand error')
+                secondary += r[queryname]
+            except:
+                pass
+
+        # fetch primary gene
+        try:
+            assert genes
+        except AssertionError:
+            print >> sys.stderr, "\n### NOT FOUND ###", str(s)
+            #raise Exception("gene not found")
+        else:
+            for gene in genes:
+                if s.introns:
+                    # full gene (plus flanks plus upstream)
+                    if s.utr:
+                        if gene.strand == "+":
+                            s.coordinates.append([ gene.chrom, gene.chromStart-s.upstream, gene.chromEnd, s.geneName ])
+                        elif gene.strand == "-":
+                            s.coordinates.append([ gene.chrom, gene.chromStart, gene.chromEnd+s.upstream, s.geneName ])
                         else:
-                            if gene.strand == "+":
-                                s.coordinates.append([ gene.chrom, gene.thickStart-s.upstream, gene.thickEnd, s.geneName ])
-                            elif gene.strand == "-":
-                                s.coordinates.append([ gene.chrom, gene.thickStart, gene.thickEnd+s.upstream, s.geneName ])
-                            else:
-                                raise Exception('Strand error')
+                            raise Exception('Strand error')
                     else:
-                        # exons (flanks and upstream)
-                        # extract segments and write
-                        cds = not s.utr
-                        blocks = gene.getBlocks(thick=cds)
-
-                        # extend into introns and upstreams
-                        if gene.strand == '+':
-                            s.coordinates.append([ gene.chrom, blocks[0][0]-s.upstream, blocks[0][1]+s.flanks, s.geneName ])
-                            for b in blocks[1:]:
-                                s.coordinates.append([ gene.chrom, b[0]-s.flanks, b[1]+s.flanks, s.geneName ])
-                        elif gene.strand == '-':
-                            for b in blocks[:-1]:
-                                s.coordinates.append([ gene.chrom, b[0]-s.flanks, b[1]+s.flanks, s.geneName ])
-                            s.coordinates.append([ gene.chrom, blocks[-1][0]-s.flanks, blocks[-1][1]+s.upstream, s.geneName ])
+                        if gene.strand == "+":
+                            s.coordinates.append([ gene.chrom, gene.thickStart-s.upstream, gene.thickEnd, s.geneName ])
+                        elif gene.strand == "-":
+                            s.coordinates.append([ gene.chrom, gene.thickStart, gene.thickEnd+s.upstream, s.geneName ])
                         else:
                             raise Exception('Strand error')
-
-            # fetch secondary genes (don't add any introns)
-            try:
-                assert secondary
-            except AssertionError:
-                pass  # no secondary annotation found
-            else:
-                for gene in secondary:
+                else:
                     # exons (flanks and upstream)
                     # extract segments and write
                     cds = not s.utr
@@ -301,10 +298,79 @@ if __name__=="__main__":
                     else:
                         raise Exception('Strand error')
 
-        # print blocks
+        # fetch secondary genes (don't add any introns)
         try:
-            s.flattenAndCloseGaps()  # flatten coordinates for more concise output
-            print s.BED()
-        except:
-            print >> sys.stderr, s.coordinates
-            raise
+            assert secondary
+        except AssertionError:
+            pass  # no secondary annotation found
+        else:
+            for gene in secondary:
+                # exons (flanks and upstream)
+                # extract segments and write
+                cds = not s.utr
+                blocks = gene.getBlocks(thick=cds)
+
+                # extend into introns and upstreams
+                if gene.strand == '+':
+                    s.coordinates.append([ gene.chrom, blocks[0][0]-s.upstream, blocks[0][1]+s.flanks, s.geneName ])
+                    for b in blocks[1:]:
+                        s.coordinates.append([ gene.chrom, b[0]-s.flanks, b[1]+s.flanks, s.geneName ])
+                elif gene.strand == '-':
+                    for b in blocks[:-1]:
+                        s.coordinates.append([ gene.chrom, b[0]-s.flanks, b[1]+s.flanks, s.geneName ])
+                    s.coordinates.append([ gene.chrom, blocks[-1][0]-s.flanks, blocks[-1][1]+s.upstream, s.geneName ])
+                else:
+                    raise Exception('Strand error')
+    return
+
+
+if __name__=="__main__":
+
+    usage = "usage: %prog [options] <ANNOTATION1> [ANNOTATION2] ..."
+    parser = OptionParser(usage=usage)
+    parser.add_option("-s", "--specs", dest="specs", metavar="FILE", help="Specification file (tab from excel)")
+    parser.add_option("-y", "--synonyms", dest="synonyms", metavar="FILE", help="synonyms (from UCSC gene_info")
+    parser.add_option("-d", "--cachedir", dest="cachedir", metavar="DIR", help="keep binary annotation caches (.bedc) in DIR [none]")
+    parser.add_option("-c", "--cache", dest="cache", metavar="FILE", help="result cache, only changed specifications are recomputed [none]")
+    (options, args) = parser.parse_args()
+
+    # read specification
+    # number, gene, category, utr3, utr5, exonflanks, upstream, description
+    specs = readSpecs(options.specs)
+
+    # results of unchanged specifications (same annotation and synonym files)
+    cachefile = options.cache
+    sources = fingerprint(args + ([ options.synonyms ] if options.synonyms else []))
+    results = readResults(cachefile, sources) if cachefile else {}
+
+    # annotations and synonyms are read when first needed
+    refindex, synonyms = None, {}
+
+    # pick regions and output BED (covered regions)
+    done, reused = {}, 0
+    for s in specs:
+        try:
+            bed = results[s.key()]
+            reused += 1
+        except KeyError:
+            if refindex is None and not s.region:
+                refindex = readAnnotations(args, options.cachedir)
+                # read synonyms
+                if options.synonyms:
+                    print >> sys.stderr, "READING synonmyms"
+                    synonyms = readSynonyms(options.synonyms)
+                    print >> sys.stderr, "READ gene symbol synonyms"
+            pickRegions(s, refindex, synonyms)
+            # print blocks
+            try:
+                s.flattenAndCloseGaps()  # flatten coordinates for more concise output
+                bed = s.BED()
+            except:
+                print >> sys.stderr, s.coordinates
+                raise
+        done[s.key()] = bed
+        print bed
+
+    if cachefile:
+        writeResults(cachefile, sources, done)
+        print >> sys.stderr, "REUSED %d of %d specifications" % (reused, len(specs))
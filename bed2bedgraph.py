@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-__doc__='''creates bedgraph from sorted bed
+__doc__='''creates bedgraph (or bigWig) from sorted bed
 
 AAAAAAAAA
      BBBBBBBBB
@@ -10,44 +10,39 @@ AAAAAAAAA
 
 import sys
 from collections import defaultdict
+from optparse import OptionParser
 import md5
 import dcbio.parse.BEDfile as BEDfile
+import dcbio.parse.BigWig as BigWig
+from dcbio.misc import Parallel
+
+def bedgraph(lines):
+    '''bedGraph lines of stacked BED lines'''
+    for s in BEDfile.mBEDstack(lines, False):
+        yield "\t".join(map(str,s[:3]+s[4:5])) + "\n"
 
 if __name__=="__main__":
-    e = None # chromosome buffer
-    for line in sys.stdin:
-        fields = line.split()
-        # check
-        try:
-            assert int(fields[1]) <= int(fields[2])
-        except:
-            print >> sys.stderr, fields
-            raise Exception("coordinate error (start bigger than end)")
-        # skip zero length
-        if int(fields[1]) == int(fields[2]):
-            continue
-        # build extensible BED instance (mBED)
-        f = BEDfile.mBED(fields)
-        if not e:
-            e = f
+    parser = OptionParser(usage="%prog [options] < sorted.bed > out.bedgraph")
+    parser.add_option("-b", "--bigwig", dest="bigwig", metavar="FILE", help="Write bigWig file instead of bedGraph")
+    parser.add_option("-g", "--genome", dest="genome", metavar="FILE", help="Chromosome sizes (required for bigWig)")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Process chromosomes in parallel [%default]")
+    parser.add_option("-k", "--karyotype", dest="karyotype", action="store_true", default=False, help="Output chromosomes in karyotype order")
+    (options, args) = parser.parse_args()
+
+    if options.bigwig:
+        if not options.genome:
+            parser.error("bigWig output requires chromosome sizes (-g)")
+        with open(options.genome) as fh:
+            bw = BigWig.BigWigWriter(options.bigwig, BigWig.readChromSizes(fh))
+        if options.processes > 1 or options.karyotype:
+            for line in Parallel.byChromosome(bedgraph, sys.stdin, options.processes, options.karyotype):
+                if Parallel.isHeader(line):
+                    continue
+                f = line.split()
+                bw.add(f[0], int(f[1]), int(f[2]), float(f[3]))
         else:
-            # sorting check
-            try:
-                if e.chr == f.chr:
-                    assert e.chrStart <= f.chrStart
-            except AssertionError:
-                raise Exception("input has to be a sorted bed file")
-            # overlap and extend
-            if e._ovp(f):
-                # shift and print up to added position, add segments
-                for s in e._shift(f.chrStart):
-                    print "\t".join(map(str,s[:3]+s[4:5]))
-                e._add(f)
-            else:
-                # print everthing and set new
-                for s in e._shift(e.chrEnd):
-                    print "\t".join(map(str,s[:3]+s[4:5]))
-                e = f
-    # do last one
-    for s in e._shift(e.chrEnd):
-        print "\t".join(map(str,s[:3]+s[4:5]))
+            for s in BEDfile.mBEDstack(Parallel.header(sys.stdin)[1], False):
+                bw.add(s[0], s[1], s[2], s[4])
+        bw.close()
+    else:
+        Parallel.run(bedgraph, sys.stdin, sys.stdout, options.processes, options.karyotype)
@@ -1,25 +1,137 @@
 #!/usr/bin/env python
 
+__doc__ = '''
+Sorts BED files of any size (external merge sort)
+- sorted runs of at most the memory budget are written to temporary files
+- runs are merged with a heap (k-way merge)
+- natural chromosome order (chr1..chr22, X, Y, M, unplaced contigs) or lexicographic
+- header lines (comments, track, browser) are written first
+'''
+
 import sys
-import re
+import os
+import heapq
+import itertools
+import shutil
+import tempfile
+import multiprocessing
+from optparse import OptionParser
 
-seqidParser = re.compile('(\D+)(\d+)(?:\S+)?\s+(\d+)\s+(\d+)')
+from dcbio.parse.BEDfile import karyotypeKey
 
-data = {}
-for line in sys.stdin:
-    # create sort key
-    m = seqidParser.match(line)
-    try:
-        sortkey = (m.group(1),int(m.group(2)),int(m.group(3)),int(m.group(4)))
-    except:
-        sys.stderr.write(line)
-        raise
-    # store
+OVERHEAD = 200  # approximate memory per line (besides the line itself) while sorting
+MAXFILES = 256  # maximum number of runs merged at once
+
+def sortkey(natural=True):
+    '''returns key function for BED lines (chromosome keys are cached)'''
+    cache = {}
+    def key(line):
+        f = line.split(None, 3)
+        try:
+            c = cache[f[0]]
+        except KeyError:
+            c = cache[f[0]] = karyotypeKey(f[0]) if natural else f[0]
+        try:
+            return (c, int(f[1]), int(f[2]))
+        except:
+            sys.stderr.write(line)
+            raise
+    return key
+
+def chunks(fh, budget, header):
+    '''yields lists of BED lines of at most budget bytes (collects header lines)'''
+    chunk, size = [], 0
+    for line in fh:
+        if line[0] == '#' or line.startswith('track') or line.startswith('browser'):
+            header.append(line)
+            continue
+        if not line.strip():
+            continue
+        if line[-1] != '\n':
+            line += '\n'
+        chunk.append(line)
+        size += len(line) + OVERHEAD
+        if size >= budget:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def sortRun(args):
+    '''sorts lines and writes them to a run file'''
+    lines, path, natural = args
+    lines.sort(key=sortkey(natural))
+    with open(path, 'w') as fh:
+        fh.writelines(lines)
+    return path
+
+def _keyed(fh, key, i):
+    for line in fh:
+        yield key(line), i, line
+
+def merge(paths, out, natural=True):
+    '''k-way merge of sorted run files (stable)'''
+    key = sortkey(natural)
+    fhs = [ open(p) for p in paths ]
+    streams = [ _keyed(fh, key, i) for i, fh in enumerate(fhs) ]
+    for k, i, line in heapq.merge(*streams):
+        out.write(line)
+    for fh in fhs:
+        fh.close()
+    return
+
+def runs(fh, tmpdir, budget, processes, natural, header):
+    '''writes sorted runs (in parallel) and returns their paths in input order'''
+    paths = []
+    tasks = ((c, os.path.join(tmpdir, 'run%06d' % i), natural) for i, c in enumerate(chunks(fh, budget, header)))
+    if processes > 1:
+        # keep at most one pending chunk per process (bounded memory)
+        pool = multiprocessing.Pool(processes)
+        pending = []
+        for t in tasks:
+            if len(pending) >= processes:
+                paths.append(pending.pop(0).get())
+            pending.append(pool.apply_async(sortRun, (t,)))
+        paths += [ p.get() for p in pending ]
+        pool.close()
+        pool.join()
+    else:
+        paths = [ sortRun(t) for t in tasks ]
+    return paths
+
+def bedSort(infh, out, memory=1024, processes=1, natural=True, tmpdir=None):
+    '''sorts BED lines from infh to out using at most about memory MB'''
+    budget = memory * 2**20 / (processes + 1)
+    header = []
+    tmpdir = tempfile.mkdtemp(prefix='bedSort', dir=tmpdir)
     try:
-        data[sortkey].append(line)
-    except:
-        data[sortkey] = [line]
+        paths = runs(infh, tmpdir, budget, processes, natural, header)
+        # reduce number of runs to what can be opened at once
+        level = 0
+        while len(paths) > MAXFILES:
+            merged = []
+            for i in range(0, len(paths), MAXFILES):
+                merged.append(os.path.join(tmpdir, 'merge%d_%06d' % (level, i)))
+                with open(merged[-1], 'w') as fh:
+                    merge(paths[i:i+MAXFILES], fh, natural)
+                for p in paths[i:i+MAXFILES]:
+                    os.remove(p)
+            paths = merged
+            level += 1
+        out.writelines(header)
+        merge(paths, out, natural)
+    finally:
+        shutil.rmtree(tmpdir)
+    return
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options] [BED ...] > sorted.bed")
+    parser.add_option("-m", "--memory", dest="memory", type="int", default=1024, metavar="MB", help="Memory budget [%default MB]")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Parallel run generation [%default]")
+    parser.add_option("-l", "--lexicographic", dest="natural", action="store_false", default=True, help="Lexicographic chromosome order (as sort -k1,1)")
+    parser.add_option("-T", "--tmpdir", dest="tmpdir", metavar="DIR", help="Directory for temporary files")
+    (options, args) = parser.parse_args()
 
-# write sorted
-for k in sorted(data.keys()):
-    sys.stdout.write(''.join(data[k]))
+    infh = itertools.chain.from_iterable(open(f) for f in args) if args else sys.stdin
+    bedSort(infh, sys.stdout, options.memory, options.processes, options.natural, options.tmpdir)
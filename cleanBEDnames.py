@@ -5,9 +5,20 @@ removes name redundancy in BED file after using mergeBed
 '''
 
 import sys
+from optparse import OptionParser
+from dcbio.misc import Parallel
 
-for line in sys.stdin:
-    f = line.split()
-    f[3] = ';'.join(list(set(f[3].split(';'))))
-    print '\t'.join(f)
+def clean(lines):
+    '''BED lines with unique names'''
+    for line in lines:
+        f = line.split()
+        f[3] = ';'.join(list(set(f[3].split(';'))))
+        yield '\t'.join(f) + '\n'
 
+if __name__=="__main__":
+    parser = OptionParser(usage="%prog [options] < in.bed")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Process chromosomes in parallel [%default]")
+    parser.add_option("-k", "--karyotype", dest="karyotype", action="store_true", default=False, help="Output chromosomes in karyotype order")
+    (options, args) = parser.parse_args()
+
+    Parallel.run(clean, sys.stdin, sys.stdout, options.processes, options.karyotype)
@@ -1,35 +1,31 @@
 #!/usr/bin/env python
 
+'''
+prints lines whose column (whitespace delimited) is one of the terms (hash join)
+multiple comma separated columns are matched against whitespace delimited terms
+USAGE: colgrep.py <termfile> <column(s)> < IN > OUT
+'''
+
 import sys
-from copy import deepcopy
+
+from dcbio.algo.matcher import Matcher
+
+col = [ int(c)-1 for c in sys.argv[2].split(',') ]
 
 keys = set()
 fh = open(sys.argv[1])
 for line in fh:
-    keys.add(line.rstrip())
+    keys.add(line.rstrip() if len(col) == 1 else tuple(line.split()))
 fh.close()
-notfound = deepcopy(keys)
 print >> sys.stderr, "Read %d terms to search" % (len(keys))
+print >> sys.stderr, "Will check in column %s" % (','.join(map(str, col)))
 
-col = int(sys.argv[2])-1
-print >> sys.stderr, "Will check in column %d" % (col)
-
-cnt = [0,0,0]
-for line in sys.stdin:
-    f = line.split()
-    try:
-        if f[col] in keys:
-            cnt[0] += 1
-            notfound.remove(f[col])
-            sys.stdout.write(line)
-        else:
-            print f[col]
-            cnt[1] += 1
-    except:
-        cnt[2] += 1
-        continue
-    print >> sys.stderr, cnt, '\r',
-print >> sys.stderr, ' matched', cnt[0]
-print >> sys.stderr, ' nomatch', cnt[1]
-print >> sys.stderr, '  failed', cnt[2]
-print >> sys.stderr, 'notfound', len(notfound)
+matcher = Matcher(keys, col, None)
+for i, line in enumerate(matcher.filter(sys.stdin)):
+    sys.stdout.write(line)
+    if i % 100000 == 0:
+        print >> sys.stderr, [matcher.matched, matcher.unmatched, matcher.failed], '\r',
+print >> sys.stderr, ' matched', matcher.matched
+print >> sys.stderr, ' nomatch', matcher.unmatched
+print >> sys.stderr, '  failed', matcher.failed
+print >> sys.stderr, 'notfound', len(keys.difference(matcher.found))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+'''
+implicit augmented interval tree (after Heng Li's cgranges)
+
+works on parallel sequences of starts and ends that are sorted by start
+the tree is laid out in the sorted array itself, so nothing is copied
+intervals are closed (bookended intervals overlap), same as BEDline.overlaps
+'''
+
+def index(starts, ends):
+    '''returns the maximum end of every subtree and the level of the root'''
+    n = len(starts)
+    if n == 0:
+        return [], -1
+    maxs = list(ends)
+    # leaves (level 0)
+    for i in xrange(0, n, 2):
+        last_i, last = i, maxs[i]
+    # internal nodes (bottom up)
+    k = 1
+    while (1 << k) <= n:
+        x = 1 << (k - 1)
+        for i in xrange((x << 1) - 1, n, x << 2):
+            el = maxs[i - x]
+            er = maxs[i + x] if i + x < n else last
+            maxs[i] = max(maxs[i], el, er)
+        # move last_i to its parent
+        last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+        if last_i < n and maxs[last_i] > last:
+            last = maxs[last_i]
+        k += 1
+    return maxs, k - 1
+
+def overlap(starts, ends, maxs, level, start, end):
+    '''yields indices of intervals overlapping [start, end] (in sorted order)'''
+    n = len(starts)
+    if level < 0:
+        return
+    stack = [((1 << level) - 1, level, 0)]
+    while stack:
+        x, k, w = stack.pop()
+        if k <= 3:
+            # small subtree, scan linearly
+            i0 = x >> k << k
+            i1 = min(i0 + (1 << (k + 1)) - 1, n)
+            for i in xrange(i0, i1):
+                if starts[i] > end:
+                    break
+                if ends[i] >= start:
+                    yield i
+        elif w == 0:
+            # left child first (may be out of range but still have children)
+            y = x - (1 << (k - 1))
+            stack.append((x, k, 1))
+            if y >= n or maxs[y] >= start:
+                stack.append((y, k - 1, 0))
+        elif x < n and starts[x] <= end:
+            if ends[x] >= start:
+                yield x
+            stack.append((x + (1 << (k - 1)), k - 1, 0))
+    return
+
+
+if __name__ == "__main__":
+
+    test = [(i,i+10) for i in range(10,50,3)]
+    maxs, level = index([ t[0] for t in test ], [ t[1] for t in test ])
+
+    key = (20,40)
+
+    print 'query', key
+    print 'test ', test
+    print [ test[i] for i in overlap([ t[0] for t in test ], [ t[1] for t in test ], maxs, level, key[0], key[1]) ]
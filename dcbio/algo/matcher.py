@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+'''
+term matching for delimited text (fgrep.py, colgrep.py)
+
+exact matching is a hash join of field keys (one or more columns) against the term set
+substring matching runs an Aho-Corasick automaton that is built once from all terms,
+so each field is scanned once whatever the number of terms
+input is read in large buffered chunks
+'''
+
+import collections
+
+CHUNKSIZE = 1 << 24  # bytes per chunk of lines
+
+def chunks(fh, size=CHUNKSIZE):
+    '''yields lists of lines of about size bytes'''
+    while True:
+        lines = fh.readlines(size)
+        if not lines:
+            break
+        yield lines
+
+
+class AhoCorasick(object):
+    '''
+    Aho-Corasick automaton over a set of strings
+    missing transitions are resolved through the failure links once and then memoized,
+    so scanning costs a single dictionary lookup per character
+    '''
+    def __init__(self, terms):
+        self.delta = [{}]  # transitions
+        self.out = [None]  # a term that ends in state (own or via failure links)
+        for t in terms:
+            if not t:
+                continue
+            s = 0
+            for ch in t:
+                nxt = self.delta[s].get(ch)
+                if nxt is None:
+                    nxt = self.delta[s][ch] = len(self.delta)
+                    self.delta.append({})
+                    self.out.append(None)
+                s = nxt
+            self.out[s] = t
+        # failure links (breadth first)
+        self.fail = [0] * len(self.delta)
+        queue = collections.deque(self.delta[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in self.delta[s].iteritems():
+                queue.append(t)
+                f = self.fail[s]
+                while f and ch not in self.delta[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.delta[f].get(ch, 0)
+                if self.out[t] is None:
+                    self.out[t] = self.out[self.fail[t]]
+        return
+
+    def __len__(self):
+        return len(self.delta)
+
+    def _step(self, s, ch):
+        '''transition from s on ch (memoized)'''
+        if s == 0:
+            t = 0
+        else:
+            f = self.fail[s]
+            t = self.delta[f].get(ch)
+            if t is None:
+                t = self._step(f, ch)
+        self.delta[s][ch] = t
+        return t
+
+    def search(self, text):
+        '''returns the first term found in text (ending first), None if there is none'''
+        delta, out = self.delta, self.out
+        s = 0
+        for ch in text:
+            try:
+                s = delta[s][ch]
+            except KeyError:
+                s = self._step(s, ch)
+            if out[s] is not None:
+                return out[s]
+        return None
+
+
+class Matcher(object):
+    '''
+    matches lines of delimited text against a set of terms
+    columns: 0-based field indices forming the key (None matches any field), multiple columns match tuples of terms
+    delim: field delimiter (None splits at whitespace)
+    substring: terms are searched within the fields (otherwise fields/keys have to match entirely)
+    counts of matched, unmatched and failed (too few fields) lines and the set of found terms are kept
+    '''
+    def __init__(self, terms, columns=None, delim='\t', substring=False):
+        self.terms = set(terms)
+        self.columns = columns
+        self.delim = delim
+        self.automaton = AhoCorasick(self.terms) if substring else None
+        self.found = set()
+        self.matched, self.unmatched, self.failed = 0, 0, 0
+        return
+
+    def scan(self, fh):
+        '''yields (line, match) for every line of fh (match is None if there is none)'''
+        terms, columns, delim = self.terms, self.columns, self.delim
+        search = self.automaton.search if self.automaton else None
+        multi = columns is not None and len(columns) > 1 and not search
+        maxsplit = max(columns) + 1 if columns else -1
+        found = self.found
+        for lines in chunks(fh):
+            for line in lines:
+                f = line.rstrip().split(delim, maxsplit)
+                if columns is None:
+                    fields = f
+                else:
+                    try:
+                        fields = [ f[c] for c in columns ]
+                    except IndexError:
+                        self.failed += 1
+                        yield line, None
+                        continue
+                m = None
+                if search:
+                    for x in fields:
+                        m = search(x)
+                        if m is not None:
+                            break
+                elif multi:
+                    key = tuple(fields)
+                    if key in terms:
+                        m = key
+                else:
+                    for x in fields:
+                        if x in terms:
+                            m = x
+                            break
+                if m is None:
+                    self.unmatched += 1
+                else:
+                    self.matched += 1
+                    found.add(m)
+                yield line, m
+        return
+
+    def filter(self, fh, negate=False):
+        '''yields lines of fh that match (or do not match if negate)'''
+        for line, m in self.scan(fh):
+            if (m is None) == negate:
+                yield line
+        return
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+'''
+chromosome name aliases of the human assemblies (UCSC, Ensembl and RefSeq accession names)
+and renaming of chromosome fields in BED/GTF/VCF and SAM streams
+
+hg19 chrM (NC_001807) is not the rCRS sequence of GRCh37 MT (NC_012920), so it has no alias in GRCh37
+unplaced, unlocalized and alt contigs are not in the tables (see Renamer for unlinked names)
+'''
+
+import re
+import sys
+
+ASSEMBLIES = {'hg19': 'GRCh37', 'hg38': 'GRCh38', 'GRCh37': 'GRCh37', 'GRCh38': 'GRCh38'}
+STYLES = ('ucsc', 'ensembl', 'refseq')
+
+# RefSeq accession versions of GRCh37 chromosomes (GRCh38 are one version up)
+_GRCH37 = [ ('1', 10), ('2', 11), ('3', 11), ('4', 11), ('5', 9), ('6', 11), ('7', 13), ('8', 10), ('9', 11), ('10', 10),
+    ('11', 9), ('12', 11), ('13', 10), ('14', 8), ('15', 9), ('16', 9), ('17', 10), ('18', 9), ('19', 9), ('20', 10),
+    ('21', 8), ('22', 10), ('X', 10), ('Y', 9) ]
+
+_aliases = {}
+
+def table(assembly):
+    '''returns rows of (ucsc, ensembl, refseq) chromosome names (None if a style has no such sequence)'''
+    try:
+        bump = ASSEMBLIES[assembly] == 'GRCh38'
+    except KeyError:
+        raise Exception('unknown assembly %s (%s)' % (assembly, ','.join(sorted(ASSEMBLIES.keys()))))
+    rows = [ ('chr' + name, name, 'NC_%06d.%d' % (i + 1, version + bump)) for i, (name, version) in enumerate(_GRCH37) ]
+    # hg19 chrM is a different mitochondrial sequence (coordinates would shift)
+    rows.append(('chrM' if bump else None, 'MT', 'NC_012920.1'))
+    return rows
+
+def aliases(assembly, style):
+    '''returns dict from any name (and unversioned accession) of assembly to name in style (cached)'''
+    key = (ASSEMBLIES.get(assembly, assembly), style)
+    try:
+        return _aliases[key]
+    except KeyError:
+        pass
+    try:
+        col = STYLES.index(style)
+    except ValueError:
+        raise Exception('unknown naming style %s (%s)' % (style, ','.join(STYLES)))
+    links = {}
+    for row in table(assembly):
+        if row[col] is None:
+            continue
+        for name in row:
+            if name is not None:
+                links[name] = row[col]
+        links[row[2].split('.')[0]] = row[col]
+    _aliases[key] = links
+    return links
+
+
+class Renamer(object):
+    '''
+    renames chromosome fields (first column or SAM RNAME/RNEXT) and @SQ/##contig headers
+    lines on unlinked chromosomes are dropped (or kept unchanged with keep) and counted in skipped
+    '''
+    def __init__(self, links, sam=False, keep=False):
+        self.links = links
+        self.sam = sam
+        self.keep = keep
+        self.skipped = {}
+        self._last = set()
+        return
+
+    def _skip(self, chrom):
+        try:
+            self.skipped[chrom] += 1
+        except KeyError:
+            self.skipped[chrom] = 1
+            print >> sys.stderr, "WARNING: unlinked chromosome %s (%s)" % (chrom, 'kept' if self.keep else 'skipped')
+
+    def header(self, line):
+        '''returns renamed @SQ and ##contig lines (others unchanged), None if unlinked'''
+        if line.startswith('@SQ'):
+            i = line.find('\tSN:') + 4
+            if i < 4:
+                return line
+            j = i + len(re.match(r'[^\t\r\n]*', line[i:]).group())
+        elif line.startswith('##contig=<ID='):
+            i = 13
+            j = i + len(re.match(r'[^,>]*', line[i:]).group())
+        else:
+            return line
+        try:
+            return line[:i] + self.links[line[i:j]] + line[j:]
+        except KeyError:
+            self._skip(line[i:j])
+            return line if self.keep else None
+
+    def tabular(self, lines):
+        '''yields lines with renamed first column'''
+        links = self.links
+        for line in lines:
+            i = line.find('\t')
+            try:
+                if i < 0:
+                    raise KeyError
+                yield links[line[:i]] + line[i:]
+            except KeyError:
+                if line[0] in '#@' or line.startswith('track') or line.startswith('browser'):
+                    line = self.header(line)
+                    if line is not None:
+                        yield line
+                elif i < 0:
+                    yield line
+                else:
+                    self._skip(line[:i])
+                    if self.keep:
+                        yield line
+
+    def samlines(self, lines):
+        '''yields SAM lines with renamed RNAME and RNEXT'''
+        links = self.links
+        for line in lines:
+            if line[0] == '@':
+                line = self.header(line)
+                if line is not None:
+                    yield line
+                continue
+            f = line.split('\t', 7)
+            if len(f) < 7:
+                yield line
+                continue
+            for k in (2, 6):
+                if f[k] != '*' and f[k] != '=':
+                    try:
+                        f[k] = links[f[k]]
+                    except KeyError:
+                        self._skip(f[k])
+                        if not self.keep:
+                            break
+            else:
+                yield '\t'.join(f)
+
+    def _chroms(self, buf, lines):
+        '''returns the first fields of the lines in buf (with a leading newline), None if not guessed'''
+        # sorted input: the chromosomes of the previous chunk and of the first and last line cover all lines
+        guess = self._last.union([ lines[0].split('\t', 1)[0], lines[-1].split('\t', 1)[0] ])
+        counts = [ (c, buf.count('\n' + c + '\t')) for c in guess ]
+        if sum(n for c, n in counts) != len(lines):
+            return None
+        self._last = set(c for c, n in counts if n)
+        return self._last
+
+    def chunk(self, lines):
+        '''
+        returns chunk of lines renamed as one string
+        chunks of sorted columnar files are renamed by replacing the line prefixes of the whole chunk
+        (one pass per chromosome), others line by line
+        '''
+        if self.sam:
+            return ''.join(self.samlines(lines))
+        if not lines or not lines[-1].endswith('\n'):
+            return ''.join(self.tabular(lines))
+        buf = '\n' + ''.join(lines)
+        links = self.links
+        chroms = self._chroms(buf, lines)
+        # headers, unlinked chromosomes and chained renames (a->b, b->c) go line by line
+        if chroms is None or not chroms.issubset(links) or chroms.intersection(links[c] for c in chroms if links[c] != c):
+            return ''.join(self.tabular(lines))
+        for c in chroms:
+            if links[c] != c:
+                buf = buf.replace('\n' + c + '\t', '\n' + links[c] + '\t')
+        return buf[1:]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+'''
+binary column store (named numpy arrays in a single memory-mappable file)
+
+    magic 'DCBC', uint32 header length, JSON header (array dtypes, shapes, offsets and metadata)
+    followed by the raw arrays (8 byte aligned)
+
+strings are stored as a table (concatenated bytes plus offsets) with an optional hash index
+no pickling is involved, so files can be opened (and shared) without executing anything
+'''
+
+import os
+import sys
+import json
+import mmap
+import struct
+import zlib
+import numpy as np
+
+MAGIC = 'DCBC'
+VERSION = 1
+
+def write(path, arrays, meta={}):
+    '''writes named arrays and metadata (to a temporary file that replaces path, open stores keep the old file)'''
+    arrays = dict((k, np.ascontiguousarray(v)) for k, v in arrays.iteritems())
+    header = { 'version': VERSION, 'meta': meta, 'arrays': {} }
+    # layout (header size depends on offsets, so iterate until stable)
+    offset, length = 0, 0
+    while True:
+        offset = _align(8 + length)
+        for k in sorted(arrays.keys()):
+            header['arrays'][k] = { 'dtype': arrays[k].dtype.str, 'shape': list(arrays[k].shape), 'offset': offset }
+            offset = _align(offset + arrays[k].nbytes)
+        encoded = json.dumps(header)
+        if len(encoded) == length:
+            break
+        length = len(encoded)
+    with open(path + '.tmp', 'wb') as fh:
+        fh.write(struct.pack('<4sI', MAGIC, length))
+        fh.write(encoded)
+        for k in sorted(arrays.keys()):
+            fh.write('\0' * (header['arrays'][k]['offset'] - fh.tell()))
+            fh.write(arrays[k].tostring())
+    os.rename(path + '.tmp', path)
+    return
+
+def load(path):
+    '''returns (arrays, metadata), arrays are read-only views of the memory-mapped file'''
+    with open(path, 'rb') as fh:
+        data = fh.read(8)
+        if len(data) < 8:
+            raise IOError('%s is truncated (no header)' % path)
+        magic, length = struct.unpack('<4sI', data)
+        if magic != MAGIC:
+            raise IOError('%s is not a column store' % path)
+        data = fh.read(length)
+        if len(data) < length:
+            raise IOError('%s is truncated (incomplete header)' % path)
+        header = json.loads(data)
+        if header['version'] != VERSION:
+            raise IOError('%s has unsupported version %s' % (path, header['version']))
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays = {}
+    for k, a in header['arrays'].iteritems():
+        dtype = np.dtype(str(a['dtype']))
+        count = int(np.prod(a['shape']))
+        if count == 0:
+            arrays[str(k)] = np.zeros(a['shape'], dtype=dtype)
+        elif a['offset'] + count * dtype.itemsize > len(mm):
+            raise IOError('%s is truncated (array %s)' % (path, k))
+        else:
+            arrays[str(k)] = np.frombuffer(mm, dtype=dtype, count=count, offset=a['offset']).reshape(a['shape'])
+    return arrays, header['meta']
+
+def _align(x):
+    return (x + 7) & ~7
+
+def cachePath(path, cachedir, ext):
+    '''cache file for path in cachedir (directory is created, name includes a hash of the absolute path)'''
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    name = '%s.%08x%s' % (os.path.basename(path), zlib.crc32(os.path.abspath(path)) & 0xffffffff, ext)
+    return os.path.join(cachedir, name)
+
+
+## string tables
+def packStrings(strings):
+    '''returns (bytes, offsets) arrays'''
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([ len(s) for s in strings ], out=offsets[1:])
+    return np.frombuffer(''.join(strings), dtype=np.uint8) if offsets[-1] else np.zeros(0, dtype=np.uint8), offsets
+
+class Strings(object):
+    '''lazy view of a string table'''
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        return
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, long, np.integer)):
+            return self.data[self.offsets[i]:self.offsets[i+1]].tostring()
+        return np.array([ self[j] for j in np.arange(len(self))[i] ], dtype=object)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+## hash index
+def strhash(s):
+    return (zlib.crc32(s) & 0xffffffff) << 32 | (zlib.adler32(s) & 0xffffffff)
+
+def hashIndex(strings):
+    '''returns (sorted hashes, record order) arrays (order is stable for equal keys)'''
+    hashes = np.array([ strhash(s) for s in strings ], dtype=np.uint64)
+    order = np.argsort(hashes, kind='mergesort')
+    return hashes[order], order
+
+def hashLookup(strings, hashes, order, key):
+    '''returns record numbers with key'''
+    h = np.uint64(strhash(key))
+    lo, hi = np.searchsorted(hashes, h, 'left'), np.searchsorted(hashes, h, 'right')
+    return [ int(i) for i in order[lo:hi] if strings[int(i)] == key ]
+
+
+if __name__ == "__main__":
+    write(sys.argv[1], { 'test': np.arange(10) }, { 'note': 'test' })
+    print load(sys.argv[1])
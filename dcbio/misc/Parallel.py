@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+'''
+per-chromosome process pool for streaming BED tools
+
+a kernel is a (picklable, module level) function taking an iterable of BED lines of one chromosome
+and returning an iterable of output lines
+input is either spooled to one temporary file per chromosome or read from a tabix-indexed BGZF file,
+kernels run in a process pool and their outputs are concatenated in input (or karyotype) order
+leading header lines (track, browser, #) are written first and not passed to the kernel
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import itertools
+import multiprocessing
+
+from dcbio.parse import BGZF
+from dcbio.parse.BEDfile import karyotypeKey
+
+MAXPOS = 1 << 29  # largest position in tabix index
+
+def isHeader(line):
+    '''track, browser, comment or blank line'''
+    return line[0] == '#' or line.startswith('track') or line.startswith('browser') or not line.strip()
+
+def header(lines):
+    '''returns leading header lines (blank lines dropped) and an iterator over the remaining data lines'''
+    lines = iter(lines)
+    head = []
+    for line in lines:
+        if not isHeader(line):
+            return head, itertools.chain([line], ( l for l in lines if not isHeader(l) ))
+        if line.strip():
+            head.append(line)
+    return head, iter([])
+
+def spool(lines, tmpdir):
+    '''writes data lines to one file per chromosome, returns [(chrom, path)] in input order'''
+    chroms, paths = [], {}
+    out, chrom = None, None
+    for line in lines:
+        c = line.split(None, 1)[0]
+        if c != chrom:
+            if out:
+                out.close()
+            if c not in paths:
+                paths[c] = os.path.join(tmpdir, 'in%06d' % len(chroms))
+                chroms.append(c)
+            out, chrom = open(paths[c], 'a'), c
+        out.write(line)
+    if out:
+        out.close()
+    return [ (c, paths[c]) for c in chroms ]
+
+def _run(args):
+    kernel, source, chrom, path, outpath = args
+    lines = BGZF.fetch(source, chrom, 0, MAXPOS) if path is None else open(path)
+    with open(outpath, 'w') as out:
+        out.writelines(kernel(lines))
+    if path is not None:
+        lines.close()
+        os.remove(path)
+    return outpath
+
+def byChromosome(kernel, source, processes=1, karyotype=False, tmpdir=None):
+    '''
+    yields leading header lines of source followed by output lines of kernel run per chromosome
+    source is an open file (sorted by chromosome) or the path of a BGZF compressed BED with tabix index
+    '''
+    tmpdir = tempfile.mkdtemp(prefix='parallel', dir=tmpdir)
+    try:
+        if isinstance(source, basestring):
+            # indexed input (workers read their chromosome)
+            with open(source, 'rb') as fh:
+                head = header(BGZF.BgzfReader(fh))[0]
+            chroms = [ (c, None) for c in BGZF.TabixIndex.read(source + '.tbi').names ]
+        else:
+            head, lines = header(source)
+            chroms = spool(lines, tmpdir)
+            source = None
+        for line in head:
+            yield line
+        if karyotype:
+            chroms.sort(key=lambda x: karyotypeKey(x[0]))
+        tasks = [ (kernel, source, c, p, os.path.join(tmpdir, 'out%06d' % i)) for i, (c, p) in enumerate(chroms) ]
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap(_run, tasks)
+        else:
+            pool = None
+            results = itertools.imap(_run, tasks)
+        # concatenate in order (results are consumed as they complete)
+        for outpath in results:
+            with open(outpath) as fh:
+                for line in fh:
+                    yield line
+            os.remove(outpath)
+        if pool:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(tmpdir)
+    return
+
+def run(kernel, source=sys.stdin, out=sys.stdout, processes=1, karyotype=False, tmpdir=None):
+    '''runs kernel over source (directly if single process in input order)'''
+    if isinstance(source, basestring) and not os.path.exists(source + '.tbi'):
+        source = open(source)
+    if processes <= 1 and not karyotype and not isinstance(source, basestring):
+        head, lines = header(source)
+        out.writelines(head)
+        out.writelines(kernel(lines))
+    else:
+        out.writelines(byChromosome(kernel, source, processes, karyotype, tmpdir))
+    return
+
+
+if __name__ == "__main__":
+    # output does not depend on the number of processes
+    import StringIO
+
+    def _echo(lines):
+        return lines
+
+    bed = 'track name=t\n#comment\nchr1\t10\t20\ta\nbrowser hide all\nchr1\t30\t40\tc\nchr2\t5\t15\tb\n'
+    outputs = []
+    for processes in (1, 2):
+        out = StringIO.StringIO()
+        run(_echo, StringIO.StringIO(bed), out, processes)
+        outputs.append(out.getvalue())
+    print outputs[1],
+    assert outputs[0] == outputs[1] == 'track name=t\n#comment\nchr1\t10\t20\ta\nchr1\t30\t40\tc\nchr2\t5\t15\tb\n', outputs
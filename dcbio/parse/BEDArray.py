@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+'''
+Columnar (struct of arrays) BED container for bulk interval arithmetic
+
+    chrom - chromosome codes (index into chromNames)
+    chromStart, chromEnd, thickStart, thickEnd - int64 coordinates
+    blockOffsets - CSR offsets (blocks of record i are blockOffsets[i]:blockOffsets[i+1])
+    blockStarts, blockEnds - absolute block coordinates (a single block for BED3-9)
+
+interval results are returned as (rows, starts, ends) arrays, rows pointing back to records
+'''
+
+import os
+import sys
+import numpy as np
+
+from dcbio.algo import iitree
+from dcbio.misc import ColumnStore
+from dcbio.parse.BEDfile import BED, BEDline, iter_bed
+
+COLUMNS = ('chrom', 'chromStart', 'chromEnd', 'score', 'strand', 'thickStart', 'thickEnd',
+           'fields', 'blockOffsets', 'blockStarts', 'blockEnds')
+
+class BEDArray(object):
+    def __init__(self, beds):
+        '''builds arrays from BEDlines (eg. a BED instance or iter_bed)'''
+        self.chromNames = []
+        codes = {}
+        chrom, starts, ends, thickStarts, thickEnds = [], [], [], [], []
+        names, scores, strands, rgbs, fields = [], [], [], [], []
+        counts, blockStarts, blockEnds = [], [], []
+        for b in beds:
+            if b.fields > 12:
+                raise Exception('BEDArray stores at most 12 columns (%s:%d has %d)' % (b.chrom, b.chromStart, b.fields))
+            try:
+                chrom.append(codes[b.chrom])
+            except KeyError:
+                codes[b.chrom] = len(self.chromNames)
+                self.chromNames.append(b.chrom)
+                chrom.append(codes[b.chrom])
+            starts.append(b.chromStart)
+            ends.append(b.chromEnd)
+            fields.append(b.fields)
+            names.append(b.name if b.fields > 3 else '')
+            scores.append(b.score if b.fields > 4 else np.nan)
+            strands.append(b.strand if b.fields > 5 else '.')
+            thickStarts.append(b.thickStart if b.fields > 6 else b.chromStart)
+            thickEnds.append(b.thickEnd if b.fields > 7 else b.chromEnd)
+            rgbs.append(b.itemRgb if b.fields > 8 else '0')
+            segments = b.segments() if b.fields >= 12 else [ (b.chromStart, b.chromEnd) ]
+            counts.append(len(segments))
+            for s in segments:
+                blockStarts.append(s[0])
+                blockEnds.append(s[1])
+        self.chrom = np.array(chrom, dtype=np.int32)
+        self.chromStart = np.array(starts, dtype=np.int64)
+        self.chromEnd = np.array(ends, dtype=np.int64)
+        self.name = np.array(names, dtype=object)
+        self.score = np.array(scores, dtype=np.float64)
+        self.strand = np.array(strands, dtype='S1')
+        self.thickStart = np.array(thickStarts, dtype=np.int64)
+        self.thickEnd = np.array(thickEnds, dtype=np.int64)
+        self.itemRgb = np.array(rgbs, dtype=object)
+        self.fields = np.array(fields, dtype=np.int8)
+        self.blockOffsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.blockOffsets[1:])
+        self.blockStarts = np.array(blockStarts, dtype=np.int64)
+        self.blockEnds = np.array(blockEnds, dtype=np.int64)
+        return
+
+    @classmethod
+    def fromFile(cls, fh):
+        '''reads BED file (in file order)'''
+        return cls(iter_bed(fh, presorted=False))
+
+    def __len__(self):
+        return len(self.chromStart)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.line(i)
+
+    def line(self, i):
+        '''returns record as BEDline'''
+        f = [ self.chromNames[self.chrom[i]], str(self.chromStart[i]), str(self.chromEnd[i]),
+              self.name[i], str(self.score[i]), self.strand[i],
+              str(self.thickStart[i]), str(self.thickEnd[i]), self.itemRgb[i] ]
+        f = f[:self.fields[i]]
+        if self.fields[i] >= 12:
+            bs = self.blockStarts[self.blockOffsets[i]:self.blockOffsets[i+1]]
+            be = self.blockEnds[self.blockOffsets[i]:self.blockOffsets[i+1]]
+            f.append(str(len(bs)))
+            f.append(','.join(map(str, be - bs)))
+            f.append(','.join(map(str, bs - self.chromStart[i])))
+        return BEDline('\t'.join(f))
+
+    def blockCounts(self):
+        return np.diff(self.blockOffsets)
+
+    def blockRows(self):
+        '''record index of every block'''
+        return np.repeat(np.arange(len(self)), self.blockCounts())
+
+    def lengths(self):
+        '''real length of records (sum of blocks)'''
+        return np.bincount(self.blockRows(), weights=self.blockEnds - self.blockStarts, minlength=len(self)).astype(np.int64)
+
+    def blocks(self):
+        '''all blocks'''
+        return self.blockRows(), self.blockStarts.copy(), self.blockEnds.copy()
+
+    def blockSubsets(self):
+        '''returns blocks split in (leftThin, thick, riteThin) as in BEDline.blockSubsets'''
+        rows = self.blockRows()
+        bs, be = self.blockStarts, self.blockEnds
+        ts, te = self.thickStart[rows], self.thickEnd[rows]
+        # blocks entirely right or left of thick, others are split (empty parts are kept as in BEDline)
+        rite = bs >= te
+        left = ~rite & (be <= ts)
+        split = ~rite & ~left
+        # thinLeft
+        m = left | (split & (bs < ts))
+        thinLeft = (rows[m], bs[m], np.where(left, be, ts)[m])
+        # thick
+        thick = (rows[split], np.maximum(bs, ts)[split], np.minimum(be, te)[split])
+        # thinRite
+        m = rite | (split & (be > te))
+        thinRite = (rows[m], np.where(rite, bs, te)[m], be[m])
+        return thinLeft, thick, thinRite
+
+    def flank(self, upstream, downstream=None, blocks=False):
+        '''extends records (or each block) up- and downstream (strand aware, clipped at 0)'''
+        downstream = upstream if downstream is None else downstream
+        if blocks:
+            rows, starts, ends = self.blocks()
+        else:
+            rows, starts, ends = np.arange(len(self)), self.chromStart.copy(), self.chromEnd.copy()
+        minus = self.strand[rows] == '-'
+        starts -= np.where(minus, downstream, upstream)
+        ends += np.where(minus, upstream, downstream)
+        np.maximum(starts, 0, out=starts)
+        return rows, starts, ends
+
+    def filter(self, mask):
+        '''returns new BEDArray with selected records (boolean mask or indices)'''
+        idx = np.flatnonzero(mask) if np.asarray(mask).dtype == bool else np.asarray(mask, dtype=np.int64)
+        new = object.__new__(BEDArray)
+        new.chromNames = self.chromNames
+        for a in ('chrom', 'chromStart', 'chromEnd', 'name', 'score', 'strand',
+                  'thickStart', 'thickEnd', 'itemRgb', 'fields'):
+            setattr(new, a, getattr(self, a)[idx])
+        # gather blocks of selected records
+        counts = self.blockCounts()[idx]
+        new.blockOffsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new.blockOffsets[1:])
+        within = np.arange(new.blockOffsets[-1]) - np.repeat(new.blockOffsets[:-1], counts)
+        bi = np.repeat(self.blockOffsets[idx], counts) + within
+        new.blockStarts = self.blockStarts[bi]
+        new.blockEnds = self.blockEnds[bi]
+        return new
+
+    ## interval index (records sorted per chromosome, implicit augmented interval tree)
+    def getIndex(self):
+        try:
+            return self._index
+        except AttributeError:
+            pass
+        order = np.lexsort((self.chromStart, self.chrom))
+        starts, ends = self.chromStart[order], self.chromEnd[order]
+        chromOffsets = np.searchsorted(self.chrom[order], np.arange(len(self.chromNames) + 1))
+        maxs = np.zeros(len(order), dtype=np.int64)
+        levels = np.zeros(len(self.chromNames), dtype=np.int64)
+        for c in xrange(len(self.chromNames)):
+            lo, hi = chromOffsets[c], chromOffsets[c+1]
+            m, levels[c] = iitree.index(starts[lo:hi].tolist(), ends[lo:hi].tolist())
+            maxs[lo:hi] = m
+        self._index = { 'idxOrder': order, 'idxStarts': starts, 'idxEnds': ends, 'idxMaxs': maxs,
+                        'idxChromOffsets': chromOffsets, 'idxLevels': levels }
+        return self._index
+
+    def query(self, chrom, start, end):
+        '''returns records overlapping region (closed, as BEDline.overlaps)'''
+        try:
+            c = self.chromNames.index(chrom)
+        except ValueError:
+            return []
+        idx = self.getIndex()
+        lo, hi = idx['idxChromOffsets'][c], idx['idxChromOffsets'][c+1]
+        hits = iitree.overlap(idx['idxStarts'][lo:hi], idx['idxEnds'][lo:hi], idx['idxMaxs'][lo:hi],
+                              idx['idxLevels'][c], start, end)
+        return [ int(idx['idxOrder'][lo + i]) for i in hits ]
+
+    ## name index
+    def _nameIndex(self):
+        try:
+            return self._names
+        except AttributeError:
+            self._names = ColumnStore.hashIndex(self.name)
+            return self._names
+
+    def getDictList(self):
+        '''name to BEDlines mapping (as BED.getDictList, decoded on lookup)'''
+        return NameIndex(self)
+
+    ## binary cache
+    def save(self, path, meta={}):
+        '''writes memory-mappable binary cache including name and interval index'''
+        arrays = dict((a, getattr(self, a)) for a in COLUMNS)
+        arrays['nameData'], arrays['nameOffsets'] = ColumnStore.packStrings(list(self.name))
+        arrays['rgbData'], arrays['rgbOffsets'] = ColumnStore.packStrings(list(self.itemRgb))
+        arrays['chromData'], arrays['chromOffsets'] = ColumnStore.packStrings(self.chromNames)
+        arrays['nameHashes'], arrays['nameOrder'] = self._nameIndex()
+        arrays.update(self.getIndex())
+        ColumnStore.write(path, arrays, meta)
+        return
+
+    @classmethod
+    def load(cls, path):
+        '''opens binary cache (memory-mapped)'''
+        arrays, meta = ColumnStore.load(path)
+        new = object.__new__(cls)
+        for a in COLUMNS:
+            setattr(new, a, arrays[a])
+        new.name = ColumnStore.Strings(arrays['nameData'], arrays['nameOffsets'])
+        new.itemRgb = ColumnStore.Strings(arrays['rgbData'], arrays['rgbOffsets'])
+        new.chromNames = list(ColumnStore.Strings(arrays['chromData'], arrays['chromOffsets']))
+        new._names = (arrays['nameHashes'], arrays['nameOrder'])
+        new._index = dict((k, v) for k, v in arrays.iteritems() if k.startswith('idx'))
+        new.meta = meta
+        return new
+
+
+class NameIndex(object):
+    '''name lookups on a BEDArray'''
+    def __init__(self, bed):
+        self.bed = bed
+        self.hashes, self.order = bed._nameIndex()
+        return
+
+    def rows(self, key):
+        return ColumnStore.hashLookup(self.bed.name, self.hashes, self.order, key)
+
+    def __contains__(self, key):
+        return len(self.rows(key)) > 0
+
+    def __getitem__(self, key):
+        rows = self.rows(key)
+        if not rows:
+            raise KeyError(key)
+        return [ self.bed.line(i) for i in rows ]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(set(self.bed.name))
+
+
+def cachedBED(path, cache=None, cachedir=None):
+    '''
+    opens BED file through a binary cache (cache file, or <cachedir>/<name>.<hash>.bedc)
+    the cache is rebuilt whenever the size or mtime of the source file change
+    without cache or cachedir nothing is written and the file is parsed into memory
+    '''
+    if not cache and cachedir:
+        cache = ColumnStore.cachePath(path, cachedir, '.bedc')
+    st = os.stat(path)
+    source = [ os.path.abspath(path), st.st_size, st.st_mtime ]
+    if cache:
+        try:
+            bed = BEDArray.load(cache)
+            assert bed.meta['source'] == source
+            return bed
+        except (IOError, OSError, ValueError, KeyError, AssertionError):
+            pass
+    with open(path) as fh:
+        bed = BEDArray(BED(fh))  # same record order as BED
+    if cache:
+        try:
+            bed.save(cache, { 'source': source })
+        except (IOError, OSError):
+            print >> sys.stderr, "WARNING: cannot write BED cache %s" % cache
+        else:
+            bed = BEDArray.load(cache)
+    return bed
+
+if __name__ == "__main__":
+    bed = BEDArray.fromFile(sys.stdin)
+    for i, l in enumerate(bed.lengths()):
+        print bed.line(i), '\t', l
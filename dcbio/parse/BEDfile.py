@@ -21,52 +21,570 @@ The 9 additional optional BED fields are:
     blockStarts - A comma-separated list of block starts. All of the blockStart positions should be calculated relative to chromStart. The number of items in this list should correspond to blockCount.
 '''
 
+import os
+import re
 import sys
+import gc
 import md5
+import bisect
+import heapq
+import itertools
+import operator
+from array import array
 
-## Binary search for BEDline
+from dcbio.algo import iitree
+from dcbio.parse import BGZF
+
+## Binary search for BEDline (compatibility wrapper for BEDindex)
 def BEDbinsearch(key,lst,checkSort=False):
+    '''
+    returns BEDlines of lst overlapping key
+    lst can be a BED or BEDindex (index is reused) or a plain list (indexed on every call)
+    '''
     # check if sorted
-    if checkSort and not all(lst[i] <= lst[i+1] for i in xrange(len(lst)-1)):
+    if checkSort and not isinstance(lst, BEDindex) and not all(lst[i] <= lst[i+1] for i in xrange(len(lst)-1)):
         lst.sort()
-    try: mid = lst[len(lst)/2]
-    except: return []
+    if isinstance(lst, BEDindex):
+        index = lst
+    elif isinstance(lst, BED):
+        index = lst.getIndex()
     else:
-        ov = []
-        if key.overlaps(mid):
-            ov.append(mid)
-            for k in lst[len(lst)/2+1:]:
-                if key.overlaps(k):
-                    ov.append(k)
+        index = BEDindex(lst)
+    return index.query(key.chrom, key.chromStart, key.chromEnd)
+
+
+## Interval index
+class BEDindex(object):
+    '''
+    per chromosome interval index (implicit augmented interval tree)
+    queries run in O(log n + k), overlaps are closed as in BEDline.overlaps
+    '''
+    def __init__(self, beds):
+        self.chroms = {}
+        bychrom = {}
+        for b in beds:
+            try:
+                bychrom[b.chrom].append(b)
+            except KeyError:
+                bychrom[b.chrom] = [b]
+        for chrom, items in bychrom.iteritems():
+            items.sort(key=lambda x: x.chromStart)  # linear if already sorted
+            starts = [ b.chromStart for b in items ]
+            ends = [ b.chromEnd for b in items ]
+            maxs, level = iitree.index(starts, ends)
+            # index of the furthest reaching interval so far (for upstream lookups)
+            reach = []
+            for i, e in enumerate(ends):
+                reach.append(i if not reach or e >= ends[reach[-1]] else reach[-1])
+            self.chroms[chrom] = (items, starts, ends, maxs, level, reach)
+        return
+
+    def _overlap(self, chrom, start, end):
+        try:
+            items, starts, ends, maxs, level, reach = self.chroms[chrom]
+        except KeyError:
+            return
+        for i in iitree.overlap(starts, ends, maxs, level, start, end):
+            yield items[i]
+
+    def query(self, chrom, start, end):
+        '''returns overlapping BEDlines'''
+        return list(self._overlap(chrom, start, end))
+
+    def count_overlaps(self, chrom, start, end):
+        '''returns number of overlapping BEDlines'''
+        return sum(1 for b in self._overlap(chrom, start, end))
+
+    def nearest(self, chrom, start, end):
+        '''returns overlapping BEDlines or else the closest up/downstream (both if equidistant)'''
+        ov = self.query(chrom, start, end)
+        if ov or chrom not in self.chroms:
+            return ov
+        items, starts, ends, maxs, level, reach = self.chroms[chrom]
+        candidates = []
+        # upstream (intervals ending furthest among those starting before query, nothing starts in between)
+        i = bisect.bisect_right(starts, start) - 1
+        if i >= 0:
+            e = ends[reach[i]]
+            candidates.extend((start - e, b) for b in self._overlap(chrom, e, e) if b.chromEnd == e)
+        # downstream (intervals with the first start after query)
+        i = bisect.bisect_right(starts, end)
+        if i < len(starts):
+            j = bisect.bisect_right(starts, starts[i], i)
+            candidates.extend((starts[i] - end, b) for b in items[i:j])
+        if not candidates:
+            return []
+        closest = min(c[0] for c in candidates)
+        return [ b for d, b in candidates if d == closest ]
+
+
+## chromosome ordering
+_karyotype = re.compile('^(?:chr)?(\d+|X|Y|M|MT)$', re.IGNORECASE)
+_chunks = re.compile('(\d+)')
+
+def karyotypeKey(chrom):
+    '''natural chromosome order (chr1..chr22, X, Y, M, then unplaced contigs in natural order)'''
+    m = _karyotype.match(chrom)
+    if m:
+        n = m.group(1).upper()
+        return (0, int(n) if n.isdigit() else 1000 + 'XYM'.index(n[0]), chrom)
+    return (1, [ int(x) if x.isdigit() else x for x in _chunks.split(chrom) ], chrom)
+
+
+## streaming BED reader
+def iter_bed(fh, presorted=True, bychrom=False, lazy=False):
+    '''
+    yields BEDlines one at a time (constant memory)
+    presorted: checks that chromosomes are contiguous and starts ascending
+    bychrom: yields (chrom, BEDline iterator) per chromosome instead
+    lazy: optional fields are decoded on first access
+    '''
+    def _lines():
+        seen = set()
+        last = None
+        for line in fh:
+            if line[0] == "#" or line.startswith('track') or not line.strip():
+                continue
+            b = BEDline(line, lazy)
+            if presorted and last is not None:
+                if b.chrom != last.chrom:
+                    if b.chrom in seen:
+                        raise Exception('input has to be a sorted bed file (%s is not contiguous)' % b.chrom)
+                    seen.add(last.chrom)
+                elif b.chromStart < last.chromStart:
+                    raise Exception('input has to be a sorted bed file (%s:%d)' % (b.chrom, b.chromStart))
+            last = b
+            yield b
+    if bychrom:
+        return itertools.groupby(_lines(), key=lambda x: x.chrom)
+    return _lines()
+
+
+## indexed region queries
+def fetch(path, chrom, start, end):
+    '''
+    yields BEDlines overlapping region (half-open, as tabix) from a BGZF compressed BED
+    only blocks listed in the tabix index are decompressed (index is built if missing or older than path)
+    '''
+    if not os.path.exists(path + '.tbi') or os.path.getmtime(path + '.tbi') < os.path.getmtime(path):
+        BGZF.index(path)
+    for line in BGZF.fetch(path, chrom, start, end):
+        yield BEDline(line)
+
+
+## k-way sweep line over block lists
+def _endpoints(blocks, i):
+    # ends sort before starts at the same position (bookended blocks do not overlap)
+    events = []
+    for b in blocks:
+        if b[1] > b[0]:
+            events.append((b[0], 1, i))
+            events.append((b[1], 0, i))
+    events.sort()  # linear for sorted non-overlapping blocks
+    return events
+
+def sweep(blocklists):
+    '''
+    single pass over the sorted endpoints of N lists of half-open blocks
+    returns (intersection, union, coverage, shared)
+        intersection - segments covered by all inputs
+        union - segments covered by any input
+        coverage - bases covered per input
+        shared - number of block starts and block ends found in every input (zero-length blocks are ignored)
+    '''
+    n = len(blocklists)
+    depth, opened, coverage = [0] * n, [None] * n, [0] * n
+    intersection, union = [], []
+    active, last = 0, None
+    shared, boundary, members = 0, None, set()
+    for pos, kind, i in heapq.merge(*[ _endpoints(bl, i) for i, bl in enumerate(blocklists) ]):
+        # segment since last endpoint
+        if active and pos > last:
+            if union and union[-1][1] == last:
+                union[-1] = (union[-1][0], pos)
+            else:
+                union.append((last, pos))
+            if active == n:
+                if intersection and intersection[-1][1] == last:
+                    intersection[-1] = (intersection[-1][0], pos)
                 else:
-                    break
-            for i in range(len(lst)/2-1,-1, -1):
-                if key.overlaps(lst[i]):
-                    ov.append(lst[i])
+                    intersection.append((last, pos))
+        last = pos
+        # boundaries shared by all inputs
+        if (pos, kind) != boundary:
+            if len(members) == n:
+                shared += 1
+            boundary, members = (pos, kind), set()
+        members.add(i)
+        # update depth of input
+        if kind:
+            if depth[i] == 0:
+                active += 1
+                opened[i] = pos
+            depth[i] += 1
+        else:
+            depth[i] -= 1
+            if depth[i] == 0:
+                active -= 1
+                coverage[i] += pos - opened[i]
+    if n and len(members) == n:
+        shared += 1
+    return intersection, union, coverage, shared
+
+
+## multi-sample depth
+def _depthEvents(beds, i, key):
+    # (chromKey, position, +1/-1, sample, chrom) in sorted order (ends before starts at the same position)
+    ends = []
+    chrom, last = None, None
+    for b in beds:
+        if b.chromStart == b.chromEnd:
+            continue
+        if b.chrom != chrom:
+            while ends:
+                yield (ck, heapq.heappop(ends), -1, i, chrom)
+            chrom, ck = b.chrom, key(b.chrom)
+            if last is not None and ck <= last:
+                raise Exception('input %d has to be a sorted bed file (%s is not in order)' % (i, chrom))
+            last, start = ck, 0
+        elif b.chromStart < start:
+            raise Exception('input %d has to be a sorted bed file (%s:%d)' % (i, chrom, b.chromStart))
+        start = b.chromStart
+        while ends and ends[0] <= start:
+            yield (ck, heapq.heappop(ends), -1, i, chrom)
+        yield (ck, start, 1, i, chrom)
+        heapq.heappush(ends, b.chromEnd)
+    while ends:
+        yield (ck, heapq.heappop(ends), -1, i, chrom)
+
+def depthSegments(samples, key=None):
+    '''
+    k-way merge of sorted BEDline streams (one per sample)
+    yields (chrom, start, end, depths) for every elementary segment covered in any sample
+    all inputs have to be sorted in the same chromosome order (lexicographic by default, eg. key=karyotypeKey)
+    '''
+    key = key or (lambda x: x)
+    depth = [0] * len(samples)
+    active, row = 0, None
+    chrom, last = None, None
+    for ck, pos, delta, i, c in heapq.merge(*[ _depthEvents(s, i, key) for i, s in enumerate(samples) ]):
+        if c != chrom:
+            chrom, last = c, pos
+        if active and pos > last:
+            # extend previous row if contiguous with the same depths
+            if row and row[0] == chrom and row[2] == last and row[3] == depth:
+                row[2] = pos
+            else:
+                if row:
+                    yield row[0], row[1], row[2], tuple(row[3])
+                row = [ chrom, last, pos, list(depth) ]
+        last = pos
+        depth[i] += delta
+        active += 1 if delta > 0 and depth[i] == 1 else -1 if delta < 0 and depth[i] == 0 else 0
+    if row:
+        yield row[0], row[1], row[2], tuple(row[3])
+
+
+## active segment ends (shared by overlapMerge and mBED)
+class _EndHeap(object):
+    '''current end per key in a min-heap (ends only grow, superseded heap entries are skipped)'''
+    def __init__(self):
+        self.current = {}  # key -> end
+        self.heap = []  # (end, key)
+        return
+
+    def __iter__(self):
+        return iter(self.current)
+
+    def push(self, key, end):
+        '''sets or extends end of key'''
+        current = self.current.get(key)
+        if current is None or end > current:
+            self.current[key] = end
+            heapq.heappush(self.heap, (end, key))
+        return
+
+    def cut(self, to):
+        '''returns (position, keys), position is the lowest end (at most to), keys ending there are removed'''
+        heap, current = self.heap, self.current
+        while heap:
+            pos, key = heap[0]
+            if current.get(key) == pos:
+                break
+            heapq.heappop(heap)
+        else:
+            return to, []
+        if pos > to:
+            return to, []
+        keys = []
+        while heap and heap[0][0] == pos:
+            end, key = heapq.heappop(heap)
+            if current.get(key) == end:
+                del current[key]
+                keys.append(key)
+        return pos, keys
+
+    def clear(self):
+        self.current.clear()
+        del self.heap[:]
+        return
+
+
+## overlap merge (combined names of overlapping features)
+class _OverlapStack(object):
+    '''active names of the current stack (names are interned to integer ids while active)'''
+    def __init__(self):
+        self.ids, self.names, self.free = {}, [], []
+        self.ends = _EndHeap()  # id -> end
+        self.chrom, self.pos, self.chromEnd = None, 0, 0
+        self.label = None  # joined names (built on emission)
+        return
+
+    def add(self, names, end):
+        push = self.ends.push
+        for n in names:
+            try:
+                i = self.ids[n]
+            except KeyError:
+                i = self.free.pop() if self.free else len(self.names)
+                if i == len(self.names):
+                    self.names.append(n)
                 else:
-                    break
-            return ov
+                    self.names[i] = n
+                self.ids[n] = i
+                self.label = None
+            push(i, end)
+        if end > self.chromEnd:
+            self.chromEnd = end
+        return
+
+    def shift(self, to):
+        '''returns pieces up to position (ended names are released)'''
+        pieces = []
+        ends = self.ends
+        while self.pos < to:
+            if self.label is None:
+                self.label = ';'.join(sorted([ self.names[i] for i in ends ]))
+            segmentTo, ended = ends.cut(to)
+            pieces.append((self.chrom, self.pos, segmentTo, self.label))
+            self.pos = segmentTo
+            for i in ended:
+                del self.ids[self.names[i]]
+                self.free.append(i)
+                self.label = None
+        return pieces
+
+def overlapMerge(beds):
+    '''
+    cuts sorted BEDlines at every feature start and end and yields (chrom, start, end, names) of covered pieces
+    names are the sorted union of the (';' separated) names of the features covering a piece
+    '''
+    stack = _OverlapStack()
+    for b in beds:
+        if b.chromStart == b.chromEnd:
+            continue
+        names = set(b.name.split(';'))
+        if b.chrom == stack.chrom and b.chromStart <= stack.chromEnd:
+            if b.chromStart < stack.pos:
+                raise Exception('input has to be a sorted bed file (%s:%d)' % (b.chrom, b.chromStart))
+            for piece in stack.shift(b.chromStart):
+                yield piece
         else:
-            return BEDbinsearch(key,lst[:len(lst)/2]) + BEDbinsearch(key, lst[len(lst)/2+1:])
+            for piece in stack.shift(stack.chromEnd):
+                yield piece
+            # nothing is active, remaining ends are stale
+            stack.ends.clear()
+            stack.chrom, stack.pos, stack.chromEnd = b.chrom, b.chromStart, b.chromEnd
+        stack.add(names, b.chromEnd)
+    for piece in stack.shift(stack.chromEnd):
+        yield piece
+
+
+## merge entries by name
+def _flatten(segments):
+    '''sorted union of overlapping or bookended segments'''
+    merged = []
+    for s, e in sorted(segments):
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1][1] = e
+        else:
+            merged.append([s, e])
+    return merged
+
+def mergeByName(beds, mergeby='name'):
+    '''
+    yields one BED12 per group of consecutive BEDlines with the same name (or other attribute)
+    every entry becomes a block (blocks of BED12 entries are ignored), overlapping and bookended blocks are flattened
+    memory is bounded by the largest group (a name that reappears after its group is not detected and yields another BED12)
+    '''
+    for key, group in itertools.groupby(beds, key=operator.attrgetter(mergeby)):
+        group = list(group)
+        chrom, strand = group[0].chrom, getattr(group[0], 'strand', '.')
+        if len(group) > 1:
+            if len(set([ b.chrom for b in group ])) > 1:
+                raise Exception('%s is on more than one chromosome' % key)
+            if len(set([ getattr(b, 'strand', '.') for b in group ])) > 1:
+                raise Exception('not same strand for same feature name (%s)' % key)
+        thick = [ (b.thickStart, b.thickEnd) for b in group if b.fields > 7 and b.thickStart < b.thickEnd ]
+        blocks = _flatten([ (b.chromStart, b.chromEnd) for b in group ])
+        start, end = blocks[0][0], blocks[-1][1]
+        thickStart, thickEnd = (min(t[0] for t in thick), max(t[1] for t in thick)) if thick else (start, end)
+        yield BEDline('\t'.join([ chrom, str(start), str(end), str(key), '0', strand, str(thickStart), str(thickEnd), '0',
+            str(len(blocks)), ','.join([ str(b[1] - b[0]) for b in blocks ]), ','.join([ str(b[0] - start) for b in blocks ]) ]))
+
+
+## transcript part extraction
+PARTS = {
+    '5utr': '5\'-UTR (if available)',
+    'cds': 'coding sequence',
+    '3utr': '3\'-UTR (if available)',
+    'exon': 'all exons',
+    'intron': 'all introns',
+    '5prime': '5\' exon',
+    '3prime': '3\' exon',
+    'intergenic': 'sequence between consecutive transcripts (sorted input)'
+}
+_STRANDED = set(['5utr', '3utr', '5prime', '3prime'])
+
+def extractParts(beds, parts):
+    '''
+    yields (BEDline, part, blocks) for the requested parts of each BED12 transcript in order (absolute coordinates, empty parts are skipped)
+    intergenic parts are the gaps before each transcript (not covered by any preceding transcript on the chromosome)
+    and come with a new BEDline named after the flanking transcripts
+    '''
+    unknown = set(parts).difference(PARTS)
+    if unknown:
+        raise Exception('unknown part(s): %s' % ','.join(sorted(unknown)))
+    stranded = _STRANDED.intersection(parts)
+    last = None  # transcript reaching furthest on current chromosome
+    for b in beds:
+        if b.fields < 12:
+            raise Exception('only works with BED12 files')
+        if stranded and b.strand not in ('+', '-'):
+            raise Exception('strand symbol in BED12 file not +/- (%s)' % b.name)
+        c = b._blockCache()
+        forward = b.strand == '+'
+        subsets = None
+        for p in parts:
+            if p == 'exon':
+                blocks = zip(c[3], c[4])
+            elif p == 'intron':
+                blocks = zip(c[4][:-1], c[3][1:])
+            elif p == '5prime' or p == '3prime':
+                i = 0 if (p == '5prime') == forward else -1
+                blocks = [ (c[3][i], c[4][i]) ]
+            elif p == 'intergenic':
+                if last is None or last.chrom != b.chrom or last.chromEnd >= b.chromStart:
+                    continue
+                start, end = last.chromEnd, b.chromStart
+                gap = BEDline('\t'.join([ b.chrom, str(start), str(end), last.name + '|' + b.name, '0', '.',
+                    str(start), str(end), '0', '1', str(end - start), '0' ]), lazy=True)
+                yield gap, p, [ (start, end) ]
+                continue
+            else:
+                # thin/thick/thin split is shared by UTRs and CDS
+                if subsets is None:
+                    subsets = b.blockSubsets()
+                if p == 'cds':
+                    blocks = subsets[1]
+                else:
+                    blocks = subsets[0 if (p == '5utr') == forward else 2]
+            if blocks:
+                yield b, p, blocks
+        if last is None or last.chrom != b.chrom or b.chromEnd > last.chromEnd:
+            last = b
+    return
 
 
 ## BED parser
 class BED(list):
-    def __init__(self, fh, key=None):
+    def __init__(self, fh, key=None, lazy=False):
         # the sorting key provides some flexibility in ordering the features
         # for example, user might not like the lexico-order of seqid
         self.key = key or (lambda x: (x.chrom, x.chromStart, x.chromEnd))
-        for line in fh:
-            if line[0] == "#":
-                continue
-            if line.startswith('track'):
-                continue
-            self.append(BEDline(line))
+        if lazy:
+            # bulk parse in chunks, optional fields are decoded on access
+            while True:
+                lines = fh.readlines(1 << 24)
+                if not lines:
+                    break
+                list.extend(self, parseBuffer(lines))
+        else:
+            list.extend(self, (BEDline(line) for line in fh if line[0] != "#" and not line.startswith('track')))
 
         self.seqids = sorted(set(b.chrom for b in self))
         self.sort(key=self.key)
+        self._index = None
         return
 
+    def getIndex(self):
+        '''returns interval index (built on first use, dropped when the list changes)'''
+        if self._index is None:
+            self._index = BEDindex(self)
+        return self._index
+
+    # list changes invalidate the index
+    def append(self, x):
+        self._index = None
+        list.append(self, x)
+
+    def extend(self, x):
+        self._index = None
+        list.extend(self, x)
+
+    def insert(self, i, x):
+        self._index = None
+        list.insert(self, i, x)
+
+    def remove(self, x):
+        self._index = None
+        list.remove(self, x)
+
+    def pop(self, *args):
+        self._index = None
+        return list.pop(self, *args)
+
+    def sort(self, *args, **kwargs):
+        self._index = None
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._index = None
+        list.reverse(self)
+
+    def __setitem__(self, i, x):
+        self._index = None
+        list.__setitem__(self, i, x)
+
+    def __delitem__(self, i):
+        self._index = None
+        list.__delitem__(self, i)
+
+    def __setslice__(self, i, j, x):
+        self._index = None
+        list.__setslice__(self, i, j, x)
+
+    def __delslice__(self, i, j):
+        self._index = None
+        list.__delslice__(self, i, j)
+
+    def __iadd__(self, x):
+        self.extend(x)
+        return self
+
+    def query(self, chrom, start, end):
+        '''returns BEDlines overlapping region'''
+        return self.getIndex().query(chrom, start, end)
+
+    def count_overlaps(self, chrom, start, end):
+        '''returns number of BEDlines overlapping region'''
+        return self.getIndex().count_overlaps(chrom, start, end)
+
+    def nearest(self, chrom, start, end):
+        '''returns closest BEDlines to region'''
+        return self.getIndex().nearest(chrom, start, end)
+
     def get_order(self):
         return dict((f.name, (i, f)) for (i, f) in enumerate(self))
 
@@ -95,9 +613,8 @@ class BED(list):
         merge BED entries by name (create blocks)
         ignores blocks of merged entries
         '''
-        raise Exception('Function not implemented yet...')
-        #getattr(mergeby)
-        return
+        grouped = sorted(self, key=lambda x: (getattr(x, mergeby), x.chromStart))
+        return sorted(mergeByName(grouped, mergeby), key=self.key)
 
 # BED line
 class BEDline(object):
@@ -105,18 +622,17 @@ class BEDline(object):
                  "name",  "score", "strand",
                  "thickStart", "thickEnd", "itemRgb",
                  "blockCount", "blockSizes", "blockStarts",
-                 "fields","meta")
+                 "fields","meta","_blocks","_raw")
 
 
-    def __init__(self, sline):
-        args = sline.strip().split("\t")
+    def __init__(self, sline, lazy=False):
+        args = sline.strip().split("\t", 3 if lazy else -1)
         try:
             assert len(args) >= 3
         except:
             print >> sys.stderr, '##', sline, '##'
             raise Exception('BED line has less than 3 fields')
         self.fields = len(args)
-        self.meta = {}
         self.chrom = args[0]
         self.chromStart = int(args[1])
         self.chromEnd = int(args[2])
@@ -125,9 +641,17 @@ class BEDline(object):
         except AssertionError:
             print >> sys.stderr, '## ERROR ##',sline
             raise Exception('End is less than Start coordinate')
+        if lazy:
+            # optional fields are kept unsplit and decoded on first access (see __getattr__)
+            if len(args) > 3:
+                self._raw = args[3]
+                self.fields = args[3].count("\t") + 4
+            return
+        self.meta = {}
         # optional fields (now with proper typecasting)
         if len(args) > 3:
-            for i in range(3, len(args)):
+            # columns beyond BED12 are not kept (fields still counts them)
+            for i in range(3, min(len(args), 12)):
                 if i == 4:
                     # typecast
                     args[i] = float(args[i])
@@ -140,9 +664,27 @@ class BEDline(object):
                 setattr(self, BEDline.__slots__[i], args[i])
         return
 
+    def __getattr__(self, attr):
+        # only called for unset slots (lazily parsed lines and meta)
+        if attr == 'meta':
+            self.meta = {}
+            return self.meta
+        try:
+            i, cast = _LAZYFIELDS[attr]
+            args = self._raw
+        except (KeyError, AttributeError):
+            raise AttributeError(attr)
+        if not isinstance(args, list):
+            args = self._raw = args.split("\t")
+        if i >= len(args):
+            raise AttributeError(attr)
+        value = cast(args[i])
+        setattr(self, attr, value)
+        return value
+
     def __str__(self):
         fields = []
-        for i in range(self.fields):
+        for i in range(min(self.fields, 12)):
             try:
                 fields.append(getattr(self, BEDline.__slots__[i]))
             except:
@@ -152,6 +694,14 @@ class BEDline(object):
     def __getitem__(self, key):
         return getattr(self, key)
 
+    def rawFields(self):
+        '''returns list of field strings (lazily parsed lines keep their input formatting)'''
+        try:
+            tail = self._raw
+        except AttributeError:
+            return str(self).split('\t')
+        return [ self.chrom, str(self.chromStart), str(self.chromEnd) ] + (tail.split('\t') if isinstance(tail, basestring) else list(tail))
+
     def __lt__(self, other):
         return (self.chrom, self.chromStart, self.chromEnd) < (other.chrom, other.chromStart, other.chromEnd)
 
@@ -159,43 +709,57 @@ class BEDline(object):
         '''returns real length of intervals'''
         if self.fields >= 12:
             # returns bed12
-             return sum(map(int,self.blockSizes.split(',')))
+            return self._blockCache()[5]
         else:
             return self.chromEnd - self.chromStart
 
+    def _blockCache(self):
+        '''decoded block coordinates (redone only if block strings or chromStart change)'''
+        try:
+            c = self._blocks
+        except AttributeError:
+            pass
+        else:
+            if c[0] is self.blockSizes and c[1] is self.blockStarts and c[2] == self.chromStart:
+                return c
+        sizes = array('l', map(int, self.blockSizes.split(',')))
+        starts = array('l', [ self.chromStart + int(x) for x in self.blockStarts.split(',') ])
+        ends = array('l', [ starts[i] + sizes[i] for i in xrange(len(sizes)) ])
+        self._blocks = (self.blockSizes, self.blockStarts, self.chromStart, starts, ends, sum(sizes))
+        return self._blocks
+
     def segments(self):
         '''returns all absoloute coordinate segments'''
         if self.fields >= 12:
-            rawBlocks = zip(map(int,self.blockSizes.split(',')), map(int,self.blockStarts.split(',')))
-            return [ (int(self.chromStart)+b[1], int(self.chromStart)+b[1]+b[0]) for b in rawBlocks ]
+            c = self._blockCache()
+            return zip(c[3], c[4])
         return [ int(self.chromStart),int(self.chromEnd) ]
 
 
     def blockSubsets(self):
         '''returns absolute coordinate segments (thin, thick,thin)'''
-        rawBlocks = self.segments()
+        c = self._blockCache()
+        thickStart, thickEnd = int(self.thickStart), int(self.thickEnd)
         blocks = [[],[],[]] #leftThin,thick,riteThin
-        for b in rawBlocks:
-            blockStart = b[0]
-            blockEnd = b[1]
+        for blockStart, blockEnd in zip(c[3], c[4]):
             # split CDS and UTR
-            if blockStart >= int(self.thickEnd):  #thinRite
+            if blockStart >= thickEnd:  #thinRite
                 blocks[2].append((blockStart, blockEnd))
-            elif blockEnd<=int(self.thickStart):  #thinLeft
+            elif blockEnd<=thickStart:  #thinLeft
                 blocks[0].append((blockStart, blockEnd))
-            elif blockStart >= int(self.thickStart):  #thick?
-                if blockEnd <= int(self.thickEnd):  #thick
+            elif blockStart >= thickStart:  #thick?
+                if blockEnd <= thickEnd:  #thick
                     blocks[1].append((blockStart,blockEnd))
                 else:  #thick,thinRite
-                    blocks[1].append((blockStart,int(self.thickEnd)))
-                    blocks[2].append((int(self.thickEnd),blockEnd))
+                    blocks[1].append((blockStart,thickEnd))
+                    blocks[2].append((thickEnd,blockEnd))
             else:  #thinLeft,thick,?
-                blocks[0].append((blockStart,int(self.thickStart)))
-                if blockEnd<=int(self.thickEnd):  #thinLeft,thick
-                    blocks[1].append((int(self.thickStart),blockEnd))
+                blocks[0].append((blockStart,thickStart))
+                if blockEnd<=thickEnd:  #thinLeft,thick
+                    blocks[1].append((thickStart,blockEnd))
                 else:  #thinLeft,thick,thinRite
-                    blocks[1].append((int(self.thickStart),int(self.thickEnd)))
-                    blocks[2].append((int(self.thickEnd),blockEnd))
+                    blocks[1].append((thickStart,thickEnd))
+                    blocks[2].append((thickEnd,blockEnd))
         return blocks
 
     def overlaps(self,other):
@@ -206,42 +770,8 @@ class BEDline(object):
 
     def overlapfrac(self,others,thick=False):
         '''return overlapping fraction allway'''
-        coords = {}
-        # own track
-        for x in self.getBlocks(thick):
-            try:
-                coords[x[0]] += 1
-            except:
-                coords[x[0]] =  1
-            try:
-                coords[x[1]] -= 1
-            except:
-                coords[x[1]] = -1
-        # others
-        for other in others:
-            for x in other.getBlocks(thick):
-                try:
-                    coords[x[0]] += 1
-                except:
-                    coords[x[0]] =  1
-                try:
-                    coords[x[1]] -= 1
-                except:
-                    coords[x[1]] = -1
-        # evaluate
-        #levels = []
-        start, level, overlap = None, 0, []
-        for k in sorted(coords.keys()):
-            level += coords[k]
-            if start is not None:
-                assert level < len(others) + 1
-                overlap.append((start,k))
-                start = None
-            elif level == len(others) + 1:
-                start = k
-            #levels.append(level)
-        #print >> sys.stderr, "L>", levels
-        overlaplen = sum([ x[1]-x[0] for x in overlap ])
+        intersection = sweep([ self.getBlocks(thick) ] + [ o.getBlocks(thick) for o in others ])[0]
+        overlaplen = sum([ x[1]-x[0] for x in intersection ])
         return tuple([ float(overlaplen)/float(self.__len__()) ] + [ float(overlaplen)/float(len(o)) for o in others ])
 
     def _setDefaults(self):
@@ -282,13 +812,17 @@ class BEDline(object):
         blockStarts = []
         for b in blocks:
             try:
-                assert b[1] <= self.chromEnd and b[0] > self.chromStart
+                assert b[1] <= self.chromEnd and b[0] >= self.chromStart
             except:
                 raise Exception("Block is not start<end")
             blockSizes.append(b[1]-b[0])
             blockStarts.append(b[0]-self.chromStart)
         self.blockSizes = ",".join(map(str, blockSizes))
         self.blockStarts = ",".join(map(str, blockStarts))
+        self.fields = 12
+        # keep decoded blocks in sync
+        self._blocks = (self.blockSizes, self.blockStarts, self.chromStart, \
+            array('l', [ b[0] for b in blocks ]), array('l', [ b[1] for b in blocks ]), sum(blockSizes))
         return
 
     def getBlocks(self, thick=False):
@@ -323,13 +857,68 @@ class BEDline(object):
             else:
                 return [ (self.chromStart, self.chromEnd) ]
 
+# positions (after chromEnd) and typecasts of lazily decoded fields
+_LAZYFIELDS = {
+    'name': (0, str), 'score': (1, float), 'strand': (2, str),
+    'thickStart': (3, int), 'thickEnd': (4, int), 'itemRgb': (5, str),
+    'blockCount': (6, int), 'blockSizes': (7, lambda x: x.rstrip(',')), 'blockStarts': (8, lambda x: x.rstrip(','))
+}
+
+def parseBuffer(data, lazy=True):
+    '''
+    parses a whole buffer (string or list of lines) of BED lines at once
+    skips comments, track lines and blank lines, returns list of BEDlines
+    '''
+    if isinstance(data, basestring):
+        data = data.split('\n')
+    if not lazy:
+        return [ BEDline(line) for line in data if line.strip() and line[0] != '#' and not line.startswith('track') ]
+    # the new objects hold no reference cycles, so spare the collector from repeatedly traversing them
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        beds = []
+        append = beds.append
+        new = object.__new__
+        for line in data:
+            args = line.strip().split('\t', 3)
+            chrom = args[0]
+            if not chrom or chrom[0] == '#' or chrom.startswith('track'):
+                continue
+            if len(args) < 3:
+                BEDline(line)  # raises
+            b = new(BEDline)
+            b.chrom = chrom
+            b.chromStart = start = int(args[1])
+            b.chromEnd = end = int(args[2])
+            if start > end:
+                BEDline(line)  # raises
+            if len(args) > 3:
+                b._raw = args[3]
+                b.fields = args[3].count('\t') + 4
+            else:
+                b.fields = 3
+            append(b)
+    finally:
+        if enabled:
+            gc.enable()
+    return beds
+
+
 # BED line for fast overlapping
 class mBED(object):
+    '''
+    stack of overlapping segments, cut at every segment end (breakpoint)
+    segment ends are kept in an _EndHeap, score and names are updated incrementally
+    '''
     def __init__(self,fields):
         self.chr = fields[0]
         self.chrStart = int(fields[1])
         self.chrEnd = int(fields[2])
         self.segments = {}  # ends per name
+        self._ends = _EndHeap()  # name -> end
+        self._score = 0  # sum of scores of segments
+        self._names = None  # cached name string
         # get score
         try:
             score = int(fields[4])
@@ -349,6 +938,9 @@ class mBED(object):
                 print >> sys.stderr, score
 
                 raise
+        for n, s in self.segments.iteritems():
+            self._ends.push(n, s[1])
+            self._score += s[2]
         return
 
     def __str__(self):
@@ -362,44 +954,87 @@ class mBED(object):
         # check if existing segments are extended (sanity check that they actually overlap!!!)
         for k, s in other.segments.iteritems():
             try:  # does segment exist?
-                self.segments[k]
+                segment = self.segments[k]
             except KeyError:  # create new segment
                 self.segments[k] = s
-            except:  # something else is wrong
-                raise
+                self._score += s[2]
+                self._names = None
             else:  # extend existing segment
-                if s[1] > self.segments[k][1]:
-                    self.segments[k][1] = s[1]
-            finally:  # update chrEnd
-                self.chrEnd = s[1] if s[1] > self.chrEnd else self.chrEnd
-            return
-
+                if s[1] > segment[1]:
+                    segment[1] = s[1]
+            self._ends.push(k, s[1])
+            # update chrEnd
+            self.chrEnd = s[1] if s[1] > self.chrEnd else self.chrEnd
+        return
 
-    def _shift(self,toPosition):  #shift and prints to given position
+    def _shift(self,toPosition,names=True):  #shift and prints to given position
         finishedSegments = []
-        # sort segments by endpoints, print finished segements and deletes them
-        while self.chrStart < toPosition:  # if there are multiple segments...
-
-            # find lowest endpoint and collect names
-            segmentTo = [ self.segments[k][1] for k in sorted(self.segments, key=self.segments.get) ]
-
-            # set correct endpoint
-            segmentTo = min(segmentTo) if min(segmentTo) <= toPosition else toPosition
-
-            # make segment and update chrStart
-            finishedSegments.append( [self.chr, self.chrStart, segmentTo, \
-                ";".join(sorted(self.segments.keys())), sum([x[2] for x in self.segments.values()]) ] )
+        # cut at segment ends, report finished segments and delete them
+        while self.chrStart < toPosition:
+            # make segment (up to next segment end) and update chrStart
+            if names and self._names is None:
+                self._names = ";".join(sorted(self.segments.keys()))
+            segmentTo, ended = self._ends.cut(toPosition)
+            finishedSegments.append( [self.chr, self.chrStart, segmentTo, self._names, self._score ] )
             self.chrStart = segmentTo
 
             # delete ended segments to clean up
-            ended = [ n  for n,s in self.segments.iteritems() if s[1] == segmentTo ]
-            for e in ended:
-                del self.segments[e]
+            for n in ended:
+                self._score -= self.segments.pop(n)[2]
+                self._names = None
 
         return finishedSegments
 
 
+def mBEDstack(lines, names=True):
+    '''stacks sorted BED lines (mBED) and yields segments [chr, start, end, names, score]'''
+    e = None # chromosome buffer
+    for line in lines:
+        fields = line.split()
+        # check
+        try:
+            assert int(fields[1]) <= int(fields[2])
+        except:
+            print >> sys.stderr, fields
+            raise Exception("coordinate error (start bigger than end)")
+        # skip zero length
+        if int(fields[1]) == int(fields[2]):
+            continue
+        # build extensible BED instance (mBED)
+        f = mBED(fields)
+        if not e:
+            e = f
+        else:
+            # sorting check
+            try:
+                if e.chr == f.chr:
+                    assert e.chrStart <= f.chrStart
+            except AssertionError:
+                raise Exception("input has to be a sorted bed file")
+            # overlap and extend
+            if e._ovp(f):
+                # shift up to added position, add segments
+                for s in e._shift(f.chrStart, names):
+                    yield s
+                e._add(f)
+            else:
+                # everthing and set new
+                for s in e._shift(e.chrEnd, names):
+                    yield s
+                e = f
+    # do last one
+    if e:
+        for s in e._shift(e.chrEnd, names):
+            yield s
+
+
 if __name__ == "__main__":
+    # nearest returns every equidistant feature on either side
+    index = BEDindex([ BEDline('chr1\t%d\t%d\t%s' % x) for x in ((10, 50, 'a'), (20, 50, 'b'), (200, 300, 'c'), (200, 250, 'd')) ])
+    assert sorted(b.name for b in index.nearest('chr1', 125, 125)) == ['a', 'b', 'c', 'd']
+    assert sorted(b.name for b in index.nearest('chr1', 100, 100)) == ['a', 'b']
+    assert sorted(b.name for b in index.nearest('chr1', 160, 160)) == ['c', 'd']
+
     bed = BED(sys.stdin)
     for b in bed:
         print b
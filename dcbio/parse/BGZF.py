@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+'''
+BGZF block compression and tabix (.tbi) indexing for BED files
+
+BGZF files are valid gzip files made of independently compressed blocks (<64kb)
+positions are virtual offsets (compressed block offset << 16 | offset in uncompressed block)
+indexes use the UCSC binning scheme (plus a 16kb linear index) and are compatible with tabix -p bed
+'''
+
+import sys
+import struct
+import zlib
+
+BLOCKSIZE = 0xff00  # uncompressed input per block (as htslib)
+EOF = '1f8b08040000000000ff0600424302001b0003000000000000000000'.decode('hex')
+HEADER = struct.Struct('<4BI2BH2BHH')  # ID1 ID2 CM FLG MTIME XFL OS XLEN SI1 SI2 SLEN BSIZE
+LINEAR_SHIFT = 14
+
+## BGZF
+class BgzfWriter(object):
+    def __init__(self, fh, level=6):
+        self.fh = fh
+        self.level = level
+        self.buffer = []
+        self.buffered = 0
+        self.coffset = 0  # compressed offset of current block
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return
+
+    def tell(self):
+        '''virtual offset'''
+        return self.coffset << 16 | self.buffered
+
+    def write(self, data):
+        while data:
+            chunk = data[:BLOCKSIZE - self.buffered]
+            data = data[len(chunk):]
+            self.buffer.append(chunk)
+            self.buffered += len(chunk)
+            if self.buffered >= BLOCKSIZE:
+                self.flush()
+        return
+
+    def flush(self):
+        if not self.buffered:
+            return
+        data = ''.join(self.buffer)
+        c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        compressed = c.compress(data) + c.flush()
+        block = HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(compressed) + 25) + compressed + \
+            struct.pack('<2I', zlib.crc32(data) & 0xffffffff, len(data))
+        self.fh.write(block)
+        self.coffset += len(block)
+        self.buffer, self.buffered = [], 0
+        return
+
+    def close(self):
+        self.flush()
+        self.fh.write(EOF)
+        self.fh.close()
+        return
+
+
+class BgzfReader(object):
+    def __init__(self, fh):
+        self.fh = fh
+        self.coffset = 0
+        self.block = ''
+        self.uoffset = 0
+        self.next = 0  # compressed offset of next block
+        self._load(0)
+        return
+
+    def _load(self, coffset):
+        self.fh.seek(coffset)
+        header = self.fh.read(HEADER.size)
+        self.coffset = coffset
+        self.uoffset = 0
+        if len(header) < HEADER.size:
+            self.block, self.next = '', coffset
+            return
+        f = HEADER.unpack(header)
+        if f[0] != 31 or f[1] != 139 or f[8] != 66 or f[9] != 67:
+            raise IOError('not a BGZF file')
+        rest = self.fh.read(f[11] + 1 - HEADER.size)
+        self.block = zlib.decompress(rest[:-8], -15)
+        self.next = coffset + f[11] + 1
+        return
+
+    def tell(self):
+        '''virtual offset'''
+        if self.uoffset == len(self.block) and self.block:
+            return self.next << 16
+        return self.coffset << 16 | self.uoffset
+
+    def seek(self, voffset):
+        if voffset >> 16 != self.coffset:
+            self._load(voffset >> 16)
+        self.uoffset = voffset & 0xffff
+        return
+
+    def readline(self):
+        parts = []
+        while True:
+            if self.uoffset >= len(self.block):
+                if not self.block:
+                    break
+                self._load(self.next)
+                continue
+            i = self.block.find('\n', self.uoffset)
+            if i < 0:
+                parts.append(self.block[self.uoffset:])
+                self.uoffset = len(self.block)
+            else:
+                parts.append(self.block[self.uoffset:i+1])
+                self.uoffset = i + 1
+                break
+        return ''.join(parts)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def close(self):
+        self.fh.close()
+        return
+
+
+def compress(infh, outfile, level=6):
+    '''writes text stream to BGZF file'''
+    with BgzfWriter(open(outfile, 'wb'), level) as out:
+        while True:
+            data = infh.read(BLOCKSIZE)
+            if not data:
+                break
+            out.write(data)
+    return
+
+
+## binning scheme
+def reg2bin(beg, end):
+    end -= 1
+    if beg >> 14 == end >> 14: return 4681 + (beg >> 14)
+    if beg >> 17 == end >> 17: return 585 + (beg >> 17)
+    if beg >> 20 == end >> 20: return 73 + (beg >> 20)
+    if beg >> 23 == end >> 23: return 9 + (beg >> 23)
+    if beg >> 26 == end >> 26: return 1 + (beg >> 26)
+    return 0
+
+def reg2bins(beg, end):
+    end -= 1
+    bins = [0]
+    for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(xrange(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+def _isdata(line):
+    return line.strip() and line[0] != '#' and not line.startswith('track') and not line.startswith('browser')
+
+def _interval(line):
+    f = line.split('\t', 3)
+    beg, end = int(f[1]), int(f[2])
+    return f[0], beg, max(end, beg + 1)  # zero length features occupy one bin position
+
+
+## tabix index
+class TabixIndex(object):
+    def __init__(self):
+        self.names = []
+        self.refs = {}  # name -> (bins, linear)
+        return
+
+    @classmethod
+    def build(cls, path):
+        '''indexes sorted BGZF compressed BED file'''
+        index = cls()
+        reader = BgzfReader(open(path, 'rb'))
+        last = (None, -1)
+        while True:
+            begOffset = reader.tell()
+            line = reader.readline()
+            if not line:
+                break
+            if not _isdata(line):
+                continue
+            chrom, beg, end = _interval(line)
+            endOffset = reader.tell()
+            if chrom != last[0]:
+                if chrom in index.refs:
+                    raise Exception('input has to be a sorted bed file (%s is not contiguous)' % chrom)
+                index.names.append(chrom)
+                index.refs[chrom] = ({}, [])
+            elif beg < last[1]:
+                raise Exception('input has to be a sorted bed file (%s:%d)' % (chrom, beg))
+            last = (chrom, beg)
+            bins, linear = index.refs[chrom]
+            # binning index (merge adjacent chunks)
+            chunks = bins.setdefault(reg2bin(beg, end), [])
+            if chunks and chunks[-1][1] == begOffset:
+                chunks[-1][1] = endOffset
+            else:
+                chunks.append([begOffset, endOffset])
+            # linear index
+            for w in xrange(beg >> LINEAR_SHIFT, ((end - 1) >> LINEAR_SHIFT) + 1):
+                if w >= len(linear):
+                    linear.extend([None] * (w + 1 - len(linear)))
+                if linear[w] is None:
+                    linear[w] = begOffset
+        reader.close()
+        # windows without features point to the previous offset
+        for chrom in index.names:
+            linear = index.refs[chrom][1]
+            for w in xrange(len(linear)):
+                if linear[w] is None:
+                    linear[w] = linear[w-1] if w else 0
+        return index
+
+    def write(self, path):
+        names = ''.join(n + '\0' for n in self.names)
+        data = [ 'TBI\1', struct.pack('<8i', len(self.names), 0x10000, 1, 2, 3, ord('#'), 0, len(names)), names ]
+        for chrom in self.names:
+            bins, linear = self.refs[chrom]
+            data.append(struct.pack('<i', len(bins)))
+            for b in sorted(bins.keys()):
+                data.append(struct.pack('<Ii', b, len(bins[b])))
+                for chunk in bins[b]:
+                    data.append(struct.pack('<2Q', chunk[0], chunk[1]))
+            data.append(struct.pack('<i', len(linear)))
+            data.append(struct.pack('<%dQ' % len(linear), *linear))
+        data.append(struct.pack('<Q', 0))
+        with BgzfWriter(open(path, 'wb')) as out:
+            out.write(''.join(data))
+        return
+
+    @classmethod
+    def read(cls, path):
+        reader = BgzfReader(open(path, 'rb'))
+        data = ''.join(reader)
+        reader.close()
+        if data[:4] != 'TBI\1':
+            raise IOError('%s is not a tabix index' % path)
+        index = cls()
+        nref, fmt, colSeq, colBeg, colEnd, meta, skip, lnames = struct.unpack_from('<8i', data, 4)
+        p = 36
+        index.names = data[p:p+lnames].split('\0')[:nref]
+        p += lnames
+        for chrom in index.names:
+            bins = {}
+            nbin, = struct.unpack_from('<i', data, p)
+            p += 4
+            for i in xrange(nbin):
+                b, nchunk = struct.unpack_from('<Ii', data, p)
+                p += 8
+                bins[b] = [ list(struct.unpack_from('<2Q', data, p + 16 * j)) for j in xrange(nchunk) ]
+                p += 16 * nchunk
+            nintv, = struct.unpack_from('<i', data, p)
+            p += 4
+            linear = list(struct.unpack_from('<%dQ' % nintv, data, p))
+            p += 8 * nintv
+            index.refs[chrom] = (bins, linear)
+        return index
+
+    def chunks(self, chrom, start, end):
+        '''merged (begin, end) virtual offset ranges that may contain the region'''
+        try:
+            bins, linear = self.refs[chrom]
+        except KeyError:
+            return []
+        end = max(end, start + 1)
+        minOffset = 0
+        if linear:
+            minOffset = linear[min(start >> LINEAR_SHIFT, len(linear) - 1)]
+        found = []
+        for b in reg2bins(start, end):
+            for c in bins.get(b, []):
+                if c[1] > minOffset:
+                    found.append([max(c[0], minOffset), c[1]])
+        found.sort()
+        merged = []
+        for c in found:
+            if merged and c[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], c[1])
+            else:
+                merged.append(c)
+        return merged
+
+
+def index(path):
+    '''builds <path>.tbi'''
+    TabixIndex.build(path).write(path + '.tbi')
+    return path + '.tbi'
+
+def fetch(path, chrom, start, end, tbi=None):
+    '''yields lines of BGZF compressed BED overlapping region (half-open, as tabix)'''
+    tbi = tbi or TabixIndex.read(path + '.tbi')
+    reader = BgzfReader(open(path, 'rb'))
+    for c in tbi.chunks(chrom, start, end):
+        reader.seek(c[0])
+        while reader.tell() < c[1]:
+            line = reader.readline()
+            if not line:
+                break
+            if not _isdata(line):
+                continue
+            f = _interval(line)
+            if f[0] == chrom and f[1] < max(end, start + 1) and f[2] > start:
+                yield line
+    reader.close()
+    return
+
+
+if __name__ == "__main__":
+    # compress and index (like bgzip + tabix -p bed)
+    compress(open(sys.argv[1]), sys.argv[1] + '.gz')
+    print >> sys.stderr, "wrote", index(sys.argv[1] + '.gz')
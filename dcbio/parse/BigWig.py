@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+'''
+streaming bigWig writer (bedGraph sections, version 4 as written by UCSC bedGraphToBigWig)
+
+    header, zoom headers, total summary, chromosome B+ tree
+    data sections (zlib compressed, one chromosome each) and their R-tree index
+    zoom levels (summaries) and their R-tree indexes
+
+records are added in sorted order and written as they come
+zoom levels are summarised in a single pass (aligned windows, each level built from the one below)
+and spooled to temporary files, so memory is bounded by the number of blocks (for the indexes)
+'''
+
+import os
+import sys
+import struct
+import zlib
+import tempfile
+
+BIGWIG_MAGIC = 0x888FFC26
+BPT_MAGIC = 0x78CA8C91
+CIRTREE_MAGIC = 0x2468ACE0
+VERSION = 4
+BLOCKSIZE = 256  # items per index node
+ITEMSPERSLOT = 1024  # records per data section
+ZOOMBASE = 32  # reduction of first zoom level (each further level is 4 times larger)
+ZOOMLEVELS = 10
+
+HEADER = struct.Struct('<IHHQQQHHQQIQ')
+ZOOMHEADER = struct.Struct('<IIQQ')
+SUMMARY = struct.Struct('<Qdddd')
+SECTION = struct.Struct('<IIIIIBBH')
+BEDGRAPH = struct.Struct('<IIf')
+ZOOMRECORD = struct.Struct('<IIIIffff')
+
+def readChromSizes(fh):
+    '''returns [(chrom, size)] from chrom.sizes file (in file order)'''
+    sizes = []
+    for line in fh:
+        f = line.split()
+        if f and not f[0].startswith('#'):
+            sizes.append((f[0], int(f[1])))
+    return sizes
+
+
+## indexes
+def writeChromTree(fh, chroms, blockSize=BLOCKSIZE):
+    '''writes B+ tree of (name, (id, size)), names are sorted bytewise as required'''
+    items = sorted((name, i, size) for i, (name, size) in enumerate(chroms))
+    keySize = max([ len(i[0]) for i in items ] + [1])
+    blockSize = max(1, min(blockSize, len(items)))
+    fh.write(struct.pack('<IIIIQQ', BPT_MAGIC, blockSize, keySize, 8, len(items), 0))
+    # number of levels
+    levels, n = 1, len(items)
+    while n > blockSize:
+        n = (n + blockSize - 1) // blockSize
+        levels += 1
+    indexBlock = 4 + blockSize * (keySize + 8)
+    leafBlock = 4 + blockSize * (keySize + 8)
+    offset = fh.tell()
+    # index levels (top down)
+    for level in xrange(levels - 1, 0, -1):
+        slot = blockSize ** level
+        node = slot * blockSize
+        nodes = (len(items) + node - 1) // node
+        child = offset + nodes * indexBlock
+        for i in xrange(0, len(items), node):
+            count = min(blockSize, (len(items) - i + slot - 1) // slot)
+            fh.write(struct.pack('<BBH', 0, 0, count))
+            for j in xrange(count):
+                fh.write(items[i + j * slot][0].ljust(keySize, '\0') + struct.pack('<Q', child))
+                child += leafBlock if level == 1 else indexBlock
+            fh.write('\0' * ((blockSize - count) * (keySize + 8)))
+        offset += nodes * indexBlock
+    # leaves
+    for i in xrange(0, len(items), blockSize):
+        leaf = items[i:i+blockSize]
+        fh.write(struct.pack('<BBH', 1, 0, len(leaf)))
+        for name, chromId, size in leaf:
+            fh.write(name.ljust(keySize, '\0') + struct.pack('<II', chromId, size))
+        fh.write('\0' * ((blockSize - len(leaf)) * (keySize + 8)))
+    return
+
+def writeIndex(fh, blocks, itemsPerSlot, blockSize=BLOCKSIZE):
+    '''
+    writes R-tree over blocks [(startChrom, startBase, endChrom, endBase, offset, size)] in file order
+    node bounds are the true minimum and maximum of their children
+    '''
+    endOffset = fh.tell()
+    if blocks:
+        endOffset = blocks[-1][4] + blocks[-1][5]
+    # levels of bounds (leaves first)
+    levels = [ [ ((b[0], b[1]), (b[2], b[3])) for b in blocks ] ]
+    while len(levels[-1]) > blockSize:
+        below = levels[-1]
+        levels.append([ (min(c[0] for c in below[i:i+blockSize]), max(c[1] for c in below[i:i+blockSize]))
+                        for i in xrange(0, len(below), blockSize) ])
+    root = levels[-1]
+    lo = min(c[0] for c in root) if root else (0, 0)
+    hi = max(c[1] for c in root) if root else (0, 0)
+    fh.write(struct.pack('<IIQIIIIQII', CIRTREE_MAGIC, blockSize, len(blocks), lo[0], lo[1], hi[0], hi[1],
+                         endOffset, itemsPerSlot, 0))
+    if not blocks:
+        fh.write(struct.pack('<BBH', 1, 0, 0))
+        return
+    # nodes are padded to blockSize items
+    indexNode = 4 + blockSize * 24
+    leafNode = 4 + blockSize * 32
+    offset = fh.tell()
+    for level in xrange(len(levels) - 1, 0, -1):
+        # items are the bounds of the nodes one level down
+        items = levels[level]
+        nodes = (len(items) + blockSize - 1) // blockSize
+        child = offset + nodes * indexNode
+        for i in xrange(0, len(items), blockSize):
+            node = items[i:i+blockSize]
+            fh.write(struct.pack('<BBH', 0, 0, len(node)))
+            for c in node:
+                fh.write(struct.pack('<IIIIQ', c[0][0], c[0][1], c[1][0], c[1][1], child))
+                child += leafNode if level == 1 else indexNode
+            fh.write('\0' * ((blockSize - len(node)) * 24))
+        offset += nodes * indexNode
+    for i in xrange(0, len(blocks), blockSize):
+        node = blocks[i:i+blockSize]
+        fh.write(struct.pack('<BBH', 1, 0, len(node)))
+        for b in node:
+            fh.write(struct.pack('<IIIIQQ', *b))
+        fh.write('\0' * ((blockSize - len(node)) * 32))
+    return
+
+
+## zoom levels
+class ZoomLevel(object):
+    '''summaries in windows aligned to multiples of the reduction (spooled to temporary file)'''
+    def __init__(self, reduction, chromSizes, tmpdir=None):
+        self.reduction = reduction
+        self.chromSizes = chromSizes
+        self.fh = tempfile.TemporaryFile(dir=tmpdir)
+        self.blocks = []  # (startChrom, startBase, endChrom, endBase, offset, size) relative to temporary file
+        self.records = []  # pending records of current block
+        self.count = 0  # number of records
+        self.current = None  # [chromId, start, end, validCount, min, max, sum, sumSquares]
+        self.next = None  # next (larger) zoom level
+        self.maxBlock = 0  # largest uncompressed block
+        return
+
+    def add(self, chromId, start, end, value):
+        '''adds data record (split at window boundaries)'''
+        r = self.reduction
+        while start < end:
+            c = self.current
+            if c is None or c[0] != chromId or start >= c[2]:
+                self._emit()
+                window = start - start % r
+                c = self.current = [ chromId, window, min(window + r, self.chromSizes[chromId]), 0, value, value, 0.0, 0.0 ]
+            stop = min(end, c[2])
+            size = stop - start
+            c[3] += size
+            if value < c[4]: c[4] = value
+            if value > c[5]: c[5] = value
+            c[6] += value * size
+            c[7] += value * value * size
+            start = stop
+        return
+
+    def merge(self, record):
+        '''adds summary record of a lower level (nested within a window)'''
+        c = self.current
+        if c is None or c[0] != record[0] or record[1] >= c[2]:
+            self._emit()
+            window = record[1] - record[1] % self.reduction
+            c = self.current = [ record[0], window, min(window + self.reduction, self.chromSizes[record[0]]) ] + record[3:]
+            return
+        c[3] += record[3]
+        if record[4] < c[4]: c[4] = record[4]
+        if record[5] > c[5]: c[5] = record[5]
+        c[6] += record[6]
+        c[7] += record[7]
+        return
+
+    def _emit(self):
+        c = self.current
+        if c is None:
+            return
+        self.current = None
+        if self.records and self.records[-1][0] != c[0]:
+            self._flush()
+        self.records.append(c)
+        self.count += 1
+        if len(self.records) >= ITEMSPERSLOT:
+            self._flush()
+        if self.next is not None:
+            self.next.merge(c)
+        return
+
+    def _flush(self):
+        if not self.records:
+            return
+        data = ''.join([ ZOOMRECORD.pack(*c) for c in self.records ])
+        compressed = zlib.compress(data)
+        offset = self.fh.tell()
+        self.fh.write(compressed)
+        self.blocks.append((self.records[0][0], self.records[0][1], self.records[-1][0], self.records[-1][2], offset, len(compressed)))
+        self.maxBlock = max(self.maxBlock, len(data))
+        self.records = []
+        return
+
+    def finish(self):
+        self._emit()
+        self._flush()
+        if self.next is not None:
+            self.next.finish()
+        return
+
+
+## bigWig
+class BigWigWriter(object):
+    '''
+    writes sorted bedGraph records (chrom, start, end, value) to bigWig
+    chromosomes have to be contiguous and records must not overlap
+    '''
+    def __init__(self, path, chromSizes, zoomLevels=ZOOMLEVELS, tmpdir=None):
+        self.fh = open(path, 'wb')
+        self.chroms = list(chromSizes)
+        self.chromIds = dict((c[0], i) for i, c in enumerate(self.chroms))
+        sizes = [ c[1] for c in self.chroms ]
+        # zoom levels (each fed by the previous one)
+        self.zooms = [ ZoomLevel(ZOOMBASE * 4 ** i, sizes, tmpdir) for i in range(zoomLevels) ]
+        for i in range(1, len(self.zooms)):
+            self.zooms[i-1].next = self.zooms[i]
+        # summary
+        self.summary = [0, float('inf'), float('-inf'), 0.0, 0.0]
+        # leave space for header, zoom headers and summary
+        self.fh.write('\0' * (HEADER.size + ZOOMHEADER.size * len(self.zooms) + SUMMARY.size))
+        self.chromTreeOffset = self.fh.tell()
+        writeChromTree(self.fh, self.chroms)
+        self.dataOffset = self.fh.tell()
+        self.fh.write(struct.pack('<Q', 0))  # number of sections
+        self.blocks = []
+        self.records = []
+        self.maxBlock = 0
+        self.last = (None, 0)  # chromId, end
+        self.seen = set()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return
+
+    def add(self, chrom, start, end, value):
+        try:
+            chromId = self.chromIds[chrom]
+        except KeyError:
+            raise Exception('%s is not in chromosome sizes' % chrom)
+        if end > self.chroms[chromId][1] or start >= end:
+            raise Exception('invalid interval %s:%d-%d' % (chrom, start, end))
+        if chromId != self.last[0]:
+            if chromId in self.seen:
+                raise Exception('input has to be sorted (%s is not contiguous)' % chrom)
+            self.seen.add(chromId)
+            self._flush()
+        elif start < self.last[1]:
+            raise Exception('input has to be sorted and non-overlapping (%s:%d)' % (chrom, start))
+        self.last = (chromId, end)
+        value = float(value)
+        self.records.append((start, end, value))
+        if len(self.records) >= ITEMSPERSLOT:
+            self._flush()
+        # summaries
+        size = end - start
+        s = self.summary
+        s[0] += size
+        if value < s[1]: s[1] = value
+        if value > s[2]: s[2] = value
+        s[3] += value * size
+        s[4] += value * value * size
+        if self.zooms:
+            self.zooms[0].add(chromId, start, end, value)
+        return
+
+    def _flush(self):
+        if not self.records:
+            return
+        chromId = self.last[0]
+        data = SECTION.pack(chromId, self.records[0][0], self.records[-1][1], 0, 0, 1, 0, len(self.records)) + \
+            ''.join([ BEDGRAPH.pack(*r) for r in self.records ])
+        compressed = zlib.compress(data)
+        self.blocks.append((chromId, self.records[0][0], chromId, self.records[-1][1], self.fh.tell(), len(compressed)))
+        self.fh.write(compressed)
+        self.maxBlock = max(self.maxBlock, len(data))
+        self.records = []
+        return
+
+    def close(self):
+        self._flush()
+        fh = self.fh
+        indexOffset = fh.tell()
+        writeIndex(fh, self.blocks, 1)
+        # zoom levels (copy spooled data and index)
+        if self.zooms:
+            self.zooms[0].finish()
+        zoomHeaders = []
+        for z in self.zooms:
+            dataOffset = fh.tell()
+            fh.write(struct.pack('<I', z.count))
+            z.fh.seek(0)
+            while True:
+                chunk = z.fh.read(1 << 20)
+                if not chunk:
+                    break
+                fh.write(chunk)
+            z.fh.close()
+            base = dataOffset + 4
+            zoomIndex = fh.tell()
+            writeIndex(fh, [ b[:4] + (b[4] + base, b[5]) for b in z.blocks ], ITEMSPERSLOT)
+            zoomHeaders.append(ZOOMHEADER.pack(z.reduction, 0, dataOffset, zoomIndex))
+            self.maxBlock = max(self.maxBlock, z.maxBlock)
+        fh.write(struct.pack('<I', BIGWIG_MAGIC))
+        # header, zoom headers, summary and number of sections
+        fh.seek(0)
+        summaryOffset = HEADER.size + ZOOMHEADER.size * len(self.zooms)
+        fh.write(HEADER.pack(BIGWIG_MAGIC, VERSION, len(self.zooms), self.chromTreeOffset, self.dataOffset, indexOffset,
+                             0, 0, 0, summaryOffset, self.maxBlock, 0))
+        fh.write(''.join(zoomHeaders))
+        s = self.summary
+        fh.write(SUMMARY.pack(*s) if s[0] else SUMMARY.pack(0, 0, 0, 0, 0))
+        fh.seek(self.dataOffset)
+        fh.write(struct.pack('<Q', len(self.blocks)))
+        fh.close()
+        return
+
+
+if __name__ == "__main__":
+    # bedGraph to bigWig (bedGraph on stdin)
+    with BigWigWriter(sys.argv[2], readChromSizes(open(sys.argv[1]))) as bw:
+        for line in sys.stdin:
+            f = line.split()
+            if f and not line.startswith(('#', 'track', 'browser')):
+                bw.add(f[0], int(f[1]), int(f[2]), float(f[3]))
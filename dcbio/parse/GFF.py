@@ -5,11 +5,20 @@
 
 import sys
 import os
+import gc
+import time
 import copy
 import re
+import itertools
+import multiprocessing
 
+import numpy as np
 from numpy import std, median, mean
 
+from dcbio.algo import iitree
+from dcbio.misc import ColumnStore
+from dcbio.parse.BEDfile import sweep
+
 ##UNIVERSAL PARSER##
 def detect(infile):
     # autodetect filetype
@@ -33,28 +42,86 @@ def detect(infile):
     sys.stderr.write('Format is ' + ext + '\n')
     return ext
 
-def parse(infile,ext='gff'):
+def parse(infile,ext='gff',compact=False):
     sys.stderr.write('Reading ' + infile + '\n')
     exons = []
     # read by line
     linecount = 0
     fh = open(infile,'r')
-    for line in fh:
-        linecount += 1
-        if linecount % 1000 == 0:
-            sys.stderr.write("\r" + str(linecount))
-        if line.startswith('#') or len(line.rstrip()) == 0:
-            continue
-        if ext == 'gtf':
-            exons.append(GTF(line))
-        elif ext == 'gff':
-            exons.append(Generic(line))
-        else:
-            sys.exit('unknown format')
+    # the new objects hold no reference cycles (until linked), so spare the collector from repeatedly traversing them
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for line in fh:
+            linecount += 1
+            if linecount % 1000 == 0:
+                sys.stderr.write("\r" + str(linecount))
+            if line.startswith('#') or len(line.rstrip()) == 0:
+                continue
+            if ext == 'gtf':
+                exons.append(GTFFeature(line) if compact else GTF(line))
+            elif ext == 'gff':
+                exons.append(Feature(line) if compact else Generic(line))
+            else:
+                sys.exit('unknown format')
+    finally:
+        if enabled:
+            gc.enable()
     fh.close()
     sys.stderr.write('\rFound ' + str(len(exons)) + ' annotation objects\n' )
     return exons
 
+CHUNKSIZE = 1 << 22  # bytes of lines per parsing task
+
+def _parseLines(args):
+    '''parses a chunk of lines (skips comments and empty lines)'''
+    lines, ext, lazy, compact = args
+    if compact:
+        cls = GTFFeature if ext == 'gtf' else Feature
+    else:
+        cls = GTF if ext == 'gtf' else Generic
+    return [ cls(line, lazy=lazy) for line in lines if not line.startswith('#') and len(line.rstrip()) > 0 ]
+
+def iterparse(infile, ext='gff', lazy=True, processes=1, chunksize=CHUNKSIZE, compact=False):
+    '''
+    yields annotation objects in file order (constant memory)
+    lazy: attribute column is decoded on first access
+    compact: slotted Feature objects with shared attribute keys (much smaller than Generic)
+    processes: chunks of lines are parsed in a process pool (objects are numbered in file order)
+    '''
+    if ext not in ('gff', 'gtf'):
+        sys.exit('unknown format')
+    fh = open(infile) if isinstance(infile, basestring) else infile
+    tasks = ((lines, ext, lazy, compact) for lines in iter(lambda: fh.readlines(chunksize), []))
+    if processes > 1:
+        # keep a bounded number of chunks in flight
+        pool = multiprocessing.Pool(processes)
+        pending = []
+        def results():
+            for t in tasks:
+                if len(pending) >= 2 * processes:
+                    yield pending.pop(0).get()
+                pending.append(pool.apply_async(_parseLines, (t,)))
+            while pending:
+                yield pending.pop(0).get()
+    else:
+        pool = None
+        results = lambda: itertools.imap(_parseLines, tasks)
+    try:
+        for chunk in results():
+            for e in chunk:
+                if pool:
+                    # instance numbers of worker processes are meaningless
+                    e._number = e.instanceCount
+                    e.incrementCount()
+                yield e
+    finally:
+        if pool:
+            pool.terminate()
+        if fh is not infile:
+            fh.close()
+    return
+
 def ident(exons):
     unident = 0 
     for e in exons:
@@ -67,63 +134,60 @@ def ident(exons):
                 e.setUniqueIdent("U")
     return exons, unident
 
-def link(exons):
-    orphans = 0
+def link(exons,verbose=True):
+    '''
+    builds the annotation hierarchy and returns the toplevel features (linear time, stages are timed)
+    GFF3 ID/Parent (also multiple parents), PASA gene clusters, augustus transcripts,
+    ENSEMBL GTF (transcripts and genes are built) and EVIGAN (GenePrediction)
+    '''
+    lap = stopwatch(verbose)
+    parented = False
+    attribs = set()
     for e in exons:
-        if not e.hasAttribute('Parent'):
-            orphans += 1
+        if e.hasAttribute('Parent'):
+            parented = True
+            break
+        attribs.update(e._attributes.keys())
+    lap('scan')
     # link method (GFF)
-    if orphans != len(exons):
+    if parented:
         # make IDs fully unique (CDS)
         uniqID = {}
-        parents = set([])
-        redun = set([])
+        parents = set()
+        redun = set()
         for e in exons:
             # set an id if unavailable
             if not e.hasAttribute('ID'):
                 e.setUniqueIdent('UNIQ')
-            # determine uniqe ids
-            if not uniqID.has_key(e.getAttribute('ID')):
-                uniqID[e.getAttribute('ID')] = 0
-            if e._strand == '-':
-                uniqID[e.getAttribute('ID')] -= 1
-            else:
-                uniqID[e.getAttribute('ID')] += 1
-            # add to redundantID
-            if abs(uniqID[e.getAttribute('ID')]) > 1:
-                redun.add(e.getAttribute('ID'))
+            # count (strand sign numbers the exons in transcription order)
+            ident = e.getAttribute('ID')
+            uniqID[ident] = uniqID.get(ident, 0) + (-1 if e._strand == '-' else 1)
+            if abs(uniqID[ident]) > 1:
+                redun.add(ident)
             # make parent set
             if e.hasAttribute('Parent'):
-                parents.add(e.getAttribute('Parent'))
+                parents.update(e.getAttribute('Parent').split(','))
 
-        #Set negatives to zero -> absolute values number the exons 
+        #Set negatives to zero -> absolute values number the exons
         for k in uniqID.keys():
             if uniqID[k] < 0:
                 uniqID[k] = -1
 
         for e in reversed(exons):
-            if e.hasAttribute('ID') and e.getAttribute('ID') in redun:
-                if e.hasAttribute('ID') in parents:
-                    suicide('parent with non unique ID found (' + e.getAttribute('ID') + ')')
+            ident = e.getAttribute('ID')
+            if ident in redun:
+                if ident in parents:
+                    suicide('parent with non unique ID found (' + ident + ')')
                 else:
                     # renumber it
-                    newID = e.getAttribute('ID') + '.' + e._type.lower() + str(abs(uniqID[e.getAttribute('ID')]))
-                    uniqID[e.getAttribute('ID')] -= 1
-                    e.setAttribute('ID='+newID,warn=False)
-
-        # determine if PASA format with gene clusters
-        isPasa = False
-        isAugustus = False
-        if 'AUGUSTUS' in exons[0]._source:
-            isAugustus = True
-        elif 'pasa' in exons[0]._source:
-            isPasa = True
-        # PASA-like
-        if isPasa:
-            sys.stderr.write('Linking (pasa GFF3)')
-            # merge gene clusters and modify childs
+                    e.setAttribute('ID=' + ident + '.' + e._type.lower() + str(abs(uniqID[ident])),warn=False)
+                    uniqID[ident] -= 1
+        lap('unique IDs')
+
+        # PASA-like (merge gene clusters and build genes)
+        if 'pasa' in exons[0]._source and 'AUGUSTUS' not in exons[0]._source:
+            sys.stderr.write('Linking (pasa GFF3)\n')
             geneless = []
-            # index mRNA
             mRNAindex = {}
             for e in exons:
                 # exclude genes as they will be rebuilt
@@ -133,108 +197,95 @@ def link(exons):
                         parentID = e.getAttribute('Parent')
                         gene_cluster = parentID[:parentID.rfind('.')]
                         e.setAttribute('Parent='+gene_cluster)
-                        if not mRNAindex.has_key(gene_cluster):
-                            mRNAindex[gene_cluster] = []
-                        mRNAindex[gene_cluster].append(e)
+                        mRNAindex.setdefault(gene_cluster, []).append(e)
                     geneless.append(e)
-            # build genes and add to "geneless" set
             for t in mRNAindex.keys():
                geneless.append(Parent(mRNAindex[t],'gene'))
                geneless[-1].setAttribute('ID='+t)
             # sort and replace
             exons = sorted(geneless)
         # augustus (transcript -> mRNA)
-        elif isAugustus:
-            sys.stderr.write('Linking (augustus GFF3)')
+        elif 'AUGUSTUS' in exons[0]._source:
+            sys.stderr.write('Linking (augustus GFF3)\n')
             for e in exons:
                 if e._type == 'transcript':
                     e._type = 'mRNA'
         # generic GFF3
         else:
-            sys.stderr.write('Linking (generic GFF3)')
-        exons = linkAnnotation(exons)
-    else:
-        # get attributes
-        attribs = set()
+            sys.stderr.write('Linking (generic GFF3)\n')
+        lap('parents')
+    # ensembl (does not have gene and transcripts => add)
+    elif 'gene_id' in attribs and 'transcript_id' in attribs:
+        sys.stderr.write('Linking (ENSEMBL)\n')
+        exons.extend(ensemblParents(exons))
+        lap('parents')
+    # evigan-like (single mRNA per gene)
+    elif 'GenePrediction' in attribs:
+        sys.stderr.write('Linking (EVIGAN)\n')
+        # set ID
         for e in exons:
-            for a in e._attributes.keys():
-                attribs.add(a)
-        
-        # ensembl (does not have gene and transcripts => add)
-        if 'gene_id' in attribs and 'transcript_id' in attribs:
-            sys.stderr.write('Linking (ENSEMBL)')
-            # index and collect exons per gene and transcript (handles split genes)
-            indexed = {}
-            for e in exons:
-                g = e.getAttribute('gene_id') 
-                t = e.getAttribute('transcript_id')
-                h = str(e._seqid) + '|' + e.getStrand() # strand seqid hash (used for splitting superstructures which may happen during the liftOver)
-                if not indexed.has_key(g):
-                    indexed[g] = {}
-                if not indexed[g].has_key(h):
-                    indexed[g][h] = {}
-                if not indexed[g][h].has_key(t):
-                    indexed[g][h][t] = []
-                indexed[g][h][t].append(e)
-            #build transcripts and genes (and link childs)
-            added = []
-            for g in indexed.keys():
-                # split
-                subnumbering = 1
-                for h in indexed[g].keys():
-                    builtTranscripts = []
-                    for t in indexed[g][h].keys():
-                        # update subID if exons
-                        for child in indexed[g][h][t]:
-                            if len(indexed[g].keys()) > 1:
-                                child.addSubId(str(subnumbering),['transcript_id','gene_id'])
-                            child.setAttribute('ID=' + child.getAttribute('transcript_id') + '.' + child._type + child.getAttribute('exon_number'))
-                        # build transcript and set ID
-                        builtTranscripts.append(Parent(indexed[g][h][t],'mRNA'))
-                        builtTranscripts[-1].setAttribute('ID=' + builtTranscripts[-1].getAttribute('transcript_id'))
-                        # link
-                        for child in indexed[g][h][t]:
-                            builtTranscripts[-1].addChild(child)
-                    added.extend(builtTranscripts)
-                    # build gene
-                    added.append(Parent(builtTranscripts,'gene'))
-                    added[-1].setAttribute('ID=' + builtTranscripts[-1].getAttribute('gene_id'))
-                    for child in builtTranscripts:
-                        added[-1].addChild(child)
-                    subnumbering += 1
-            exons.extend(added)
-        # evigan-like (single mRNA per gene)
-        elif 'GenePrediction' in attribs:
-            sys.stderr.write('Linking (EVIGAN)\n')
-            # set ID
-            for e in exons:
-                if not e.hasAttribute('ID',True):
-                    e.setUniqueIdent("U")
-            # create parent index
-            index = {}
-            for e in exons:
-                if e._type in set(['mRNA','gene']):
-                    name = e.getAttribute('GenePrediction')
-                    if not index.has_key(e._type):
-                        index[e._type] = {}
-                    if not index[e._type].has_key(name):
-                        index[e._type][name] = []
-                    index[e._type][name].append(e)
-            # do the linking
-            for e in exons:
-                name = e.getAttribute('GenePrediction')
-                if e._type == 'gene':
-                    pass
-                elif e._type == 'mRNA':
-                    index['gene'][name][0].addChild(e,False,True) # no check, add parent
-                else:
-                    index['mRNA'][name][0].addChild(e,False,True) # no check, add parent
-                    
-        else:
-            printWarning('cannot build hierarchy (unknown structure)')
-        exons = linkAnnotation(exons,True) # do a linking rebuild to avoid duplicates (this is actually crappy, should have used a set for childs) -> returns toplevel
+            if not e.hasAttribute('ID',True):
+                e.setUniqueIdent("U")
+        # first gene and mRNA of each prediction are the parents
+        index = { 'gene': {}, 'mRNA': {} }
+        for e in exons:
+            if e._type in index:
+                index[e._type].setdefault(e.getAttribute('GenePrediction'), e)
+        for e in exons:
+            if e._type != 'gene':
+                p = index['gene' if e._type == 'mRNA' else 'mRNA'][e.getAttribute('GenePrediction')]
+                e.setAttribute('Parent=' + p.getAttribute('ID'))
+        lap('parents')
+    else:
+        printWarning('cannot build hierarchy (unknown structure)')
+    exons = linkAnnotation(exons,True)
+    lap('link')
     return exons
 
+def ensemblParents(exons):
+    '''builds transcripts and genes of ENSEMBL exons (sets Parent attributes, handles split genes)'''
+    # index and collect exons per gene and transcript
+    indexed = {}
+    for e in exons:
+        g = e.getAttribute('gene_id')
+        t = e.getAttribute('transcript_id')
+        h = str(e._seqid) + '|' + e.getStrand() # strand seqid hash (used for splitting superstructures which may happen during the liftOver)
+        indexed.setdefault(g, {}).setdefault(h, {}).setdefault(t, []).append(e)
+    #build transcripts and genes
+    added = []
+    for g in indexed.keys():
+        # split
+        split = len(indexed[g]) > 1
+        subnumbering = 1
+        for h in indexed[g].keys():
+            builtTranscripts = []
+            for t in indexed[g][h].keys():
+                childs = indexed[g][h][t]
+                # update subID if exons
+                for child in childs:
+                    if split:
+                        child.addSubId(str(subnumbering),['transcript_id','gene_id'])
+                    child.setAttribute('ID=' + child.getAttribute('transcript_id') + '.' + child._type + child.getAttribute('exon_number'))
+                # build transcript and set ID
+                builtTranscripts.append(span(Parent(childs,'mRNA'),childs))
+                builtTranscripts[-1].setAttribute('ID=' + builtTranscripts[-1].getAttribute('transcript_id'))
+                for child in childs:
+                    child.setAttribute('Parent=' + builtTranscripts[-1].getAttribute('ID'))
+            added.extend(builtTranscripts)
+            # build gene
+            added.append(span(Parent(builtTranscripts,'gene'),builtTranscripts))
+            added[-1].setAttribute('ID=' + builtTranscripts[-1].getAttribute('gene_id'))
+            for child in builtTranscripts:
+                child.setAttribute('Parent=' + added[-1].getAttribute('ID'))
+            subnumbering += 1
+    return added
+
+def span(p,childs):
+    # sets boundaries to the span of the childs
+    p._start = min([ c._start for c in childs ])
+    p._end = max([ c._end for c in childs ])
+    return p
+
 def writefh(exons,fh=sys.stdout,maxdepth=9,fileFormat='GFF'):
     for e in sorted(exons):
         e.write(fh,True,True,maxdepth,fileFormat)
@@ -242,6 +293,7 @@ def writefh(exons,fh=sys.stdout,maxdepth=9,fileFormat='GFF'):
 
 ##GLOBAL##
 def linkAnnotation(l,rebuild=False):
+    '''links childs to parents by ID/Parent attributes (Parent=a,b for multiple parents), returns toplevel'''
     # make toplevel index
     index = {}
     for e in l:
@@ -249,12 +301,11 @@ def linkAnnotation(l,rebuild=False):
             print >> sys.stderr, "## WARNING ## no ID for", repr(e)
         ident = e.getAttribute('ID')
         try:
-            assert not index.has_key(ident)
+            assert ident not in index
         except:
             print '#1',repr(index[ident])
             print '#2',repr(e)
             raise
-            suicide('non unique identifyers in file (' + e.getAttribute('ID') + ')')
         index[ident] = e
     # cleanup all child associations
     if rebuild:
@@ -263,11 +314,21 @@ def linkAnnotation(l,rebuild=False):
     # add childs (no check needed)
     toplevel = []
     for e in l:
-        if e.hasAttribute('Parent'):
-            parentID = e.getAttribute('Parent')
+        parentID = e.hasAttribute('Parent')
+        if not parentID:
+            toplevel.append(e)
+        elif ',' not in parentID:
             index[parentID].addChild(e,False)
         else:
-            toplevel.append(e)
+            # multiple parents (each once)
+            linked = set()
+            for p in parentID.split(','):
+                if p not in linked:
+                    linked.add(p)
+                    e._parent = None # not a change of parent
+                    index[p].addChild(e,False)
+            e._parent = index[parentID.split(',')[0]]
+            e.setAttribute('Parent=' + parentID)
     # return toplevel
     return toplevel
 
@@ -363,6 +424,51 @@ def covered(features):
 
 known_attributes =set(['ID','Name','Alias','Parent','Target','Gap','Derives_from','Note','Dbxref','Ontology_term'])
 
+# sortorder by type (7 is other)
+sortorder = { 'gene':1, 'mRNA':2, 'exon':3, 'start_codon':5, 'CDS':6, 'stop_codon':8, 'three_prime_utr':9 }
+
+# attribute key tables shared by Feature objects
+keytables = {}
+
+def keytable(keys):
+    # returns the shared tuple of (interned) keys
+    keys = tuple(keys)
+    try:
+        return keytables[keys]
+    except KeyError:
+        keytables[keys] = keys = tuple([ intern(k) for k in keys ])
+        return keys
+
+def gtfAttributes(column,fields):
+    # convert to GFF attributes (ID from fields)
+    att = column.split(';')
+    attributes = []
+    ID = []
+    for a in att:
+        if len(a) > 3:
+            a = a.strip() # strip whitspace
+            aSplit = a.split(' "') # split key and value
+            if len(aSplit) > 1:
+                aSplit[1] = aSplit[1][:-1] # strip quotes
+            else:
+                aSplit = a.split(' ', 1) # unquoted (eg. level 2)
+            attributes.append('='.join(aSplit))
+            if aSplit[0] in fields:
+                ID.append(aSplit[1])
+    # put an ID
+    attributes.append('ID=' + '|'.join(ID))
+    return ';'.join(attributes)
+
+def stopwatch(verbose=True):
+    # returns function reporting the time since its last call
+    last = [ time.time() ]
+    def lap(stage):
+        now = time.time()
+        if verbose:
+            sys.stderr.write('# %-10s %6.2fs\n' % (stage, now - last[0]))
+        last[0] = now
+    return lap
+
 def printWarning(string,fh=sys.stderr):
     fh.write('\n## WARNING ## ' + string + '\n')
     return
@@ -399,6 +505,7 @@ def strandInt(st):
     except:
         raise
 
+# needs a sorted list and the maximum feature length (see FeatureIndex for indexed queries)
 def binSearchRange(A,searchtuple,maxl):
     lowerIndex = None
     higherIndex = None
@@ -438,42 +545,16 @@ def binSearchRange(A,searchtuple,maxl):
 
 ##CLASSES##
 
-class Generic:
+class GenericBase(object):
+    '''
+    methods shared by all annotation features (Generic, Feature and FeatureView)
+    holds no state, so slotted subclasses have no instance dictionary
+    '''
+    __slots__ = ()
     instanceCount = 0
     @classmethod
     def incrementCount(self):
         self.instanceCount += 1
-    
-    def __init__(self,l=''):
-        f = l.split('\t')
-        try:
-            f[8]
-        except:
-            print '## STRANGE LINE ##', l
-            raise
-        self._seqid = f[0]
-        self._source = f[1]
-        self._type = f[2]
-        self._start = int(f[3]) if f[3] else None
-        self._end = int(f[4]) if f[4] else None
-        self._score = f[5]
-        self._strand = f[6]
-        self._phase = f[7]
-        self._attributes = {}
-        attrib = f[8].split(';')
-        for a in attrib:
-            if len(a) > 1:
-                self.setAttribute(a.rstrip())
-        # sortorder by type
-        sortorder = { 'gene':1, 'mRNA':2, 'exon':3, 'three_prime_utr':4, 'start_codon':5, 'CDS':6, 'stop_codon':8, 'three_prime_utr':9 } # 7 os other
-        self._sortorder = sortorder[self._type] if sortorder.has_key(self._type) else 7
-        # invisible stuff
-        self._flags = {}
-        self._parent = None
-        self._childs = [ ]
-        # unique numbering
-        self._number = self.instanceCount
-        self.incrementCount()
 
     def __lt__(self,e):
         '''for sorting'''
@@ -502,8 +583,9 @@ class Generic:
 
     def __repr__(self,f=''):
         att = []
-        for a in sorted(self._attributes.keys()):
-            att.append('='.join([a,self._attributes[a]]))
+        attributes = self._attributes
+        for a in sorted(attributes.keys()):
+            att.append('='.join([a,attributes[a]]))
         flg = []
         for f in self._flags.keys():
             if self._flags[f]: flg.append(f)
@@ -513,16 +595,18 @@ class Generic:
 
     def gtfstring(self):
         att = []
-        for a in sorted(self._attributes.keys()):
-            att.append(' '.join([ a, '"' + str(self._attributes[a]) + '"']))
+        attributes = self._attributes
+        for a in sorted(attributes.keys()):
+            att.append(' '.join([ a, '"' + str(attributes[a]) + '"']))
         return '\t'.join([ self._seqid, self._source, self._type, str(self._start), str(self._end), self._score, self._strand, self._phase]) + '\t' + '; '.join(att)
 
     def ensgtfstring(self):
         ordering = { 'gene_id':1,'transcript_id':2,'exon_number':3,'protein_id':4 }
         att = []
-        for a in sorted(self._attributes.keys()):
+        attributes = self._attributes
+        for a in sorted(attributes.keys()):
             if a in set(ordering.keys()):
-                att.append(' '.join([ a, '"' + str(self._attributes[a]) + '"']))
+                att.append(' '.join([ a, '"' + str(attributes[a]) + '"']))
         att = sorted(att,key=lambda x: ordering[x[:x.find(' ')]])
         return '\t'.join([ self._seqid, self._source, self._type, str(self._start), str(self._end), self._score, self._strand, self._phase]) + '\t' + '; '.join(att) + ';'
 
@@ -625,7 +709,7 @@ class Generic:
         return parent
         
     def setParent(self,p):
-        assert isinstance(p, Generic)
+        assert isinstance(p, GenericBase)
         if self._attributes.has_key('Parent') and self._parent:
             if self._parent is not p:
                 printWarning('parent changed')
@@ -637,7 +721,7 @@ class Generic:
         return self._attributes.has_key('ID')
 
     def addChild(self,e,check=True):
-        assert isinstance(e, Generic)
+        assert isinstance(e, GenericBase)
         self._childs.append(e)
         self._childs[-1].setParent(self)
         if check:
@@ -873,13 +957,10 @@ class Generic:
     def bottomLevelOverlap(self,other):
         if self._end < other._start or self._start > other._end or self._strand != other._strand:
             return 0
-        # overlap lists (ordered so can break when needed)
-        c = sorted(covered(self.bottomLevel()) + covered(other.bottomLevel()))
-        covScore = 0
-        for i in range(1,len(c)):
-            if c[i]._start <= c[i-1]._end:
-                covScore += c[i-1]._end - c[i]._start + 1
-        return covScore
+        # covered bases (closed coordinates as half-open blocks)
+        blocks = [ [ (f._start, f._end + 1) for f in e.bottomLevel() ] for e in (self, other) ]
+        intersection = sweep(blocks)[0]
+        return sum([ x[1] - x[0] for x in intersection ])
 
     def bottomLevel(self):
         # returns an list of tuples of stretches covered by bottomlevel
@@ -894,28 +975,227 @@ class Generic:
                 else:
                     thisChilds = nextChilds
             assert False
-        return self
+        return [ self ]
+
+class _LazyAttributes(object):
+    '''decodes the attribute column of a lazily parsed Generic (non-data descriptor)'''
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        obj._parseAttributes(obj.__dict__.pop('_rawattributes'))
+        return obj.__dict__['_attributes']
+
+class Generic(GenericBase):
+    '''annotation feature (attributes, flags and childs are plain containers)'''
+    def __init__(self,l='',lazy=False):
+        f = l.split('\t')
+        try:
+            f[8]
+        except:
+            print '## STRANGE LINE ##', l
+            raise
+        self._seqid = f[0]
+        self._source = f[1]
+        self._type = f[2]
+        self._start = int(f[3]) if f[3] else None
+        self._end = int(f[4]) if f[4] else None
+        self._score = f[5]
+        self._strand = f[6]
+        self._phase = f[7]
+        if lazy:
+            # decoded on first access (see _attributes)
+            self._rawattributes = f[8]
+        else:
+            self._parseAttributes(f[8])
+        self._sortorder = sortorder.get(self._type, 7)
+        # invisible stuff
+        self._flags = {}
+        self._parent = None
+        self._childs = [ ]
+        # unique numbering
+        self._number = self.instanceCount
+        self.incrementCount()
+
+    # only reached before the attribute column of lazily parsed lines is decoded (instance value shadows it)
+    _attributes = _LazyAttributes()
+
+    def _parseAttributes(self, column):
+        self._attributes = {}
+        attrib = column.split(';')
+        for a in attrib:
+            if len(a) > 1:
+                self.setAttribute(a.rstrip())
+        return
 
 class GTF(Generic):
-    def __init__(self,l,fields=set(['gene_id'])):
+    def __init__(self,l,fields=set(['gene_id']),lazy=False):
+        self._idfields = fields
+        Generic.__init__(self,l,lazy)
+
+    def _parseAttributes(self, column):
+        Generic._parseAttributes(self, gtfAttributes(column, self._idfields))
+
+class Feature(GenericBase):
+    '''
+    compact annotation feature (API compatible with Generic)
+    seqid, source, type, attribute keys and values are interned, attributes are a tuple of values
+    with a key table that is shared by all features with the same keys
+    flags and child lists are only allocated when set
+    '''
+    __slots__ = ('_seqid', '_source', '_type', '_start', '_end', '_score', '_strand', '_phase',
+        '_keys', '_values', '_raw', '_sortorder', '_flagdict', '_parent', '_childlist', '_number')
+
+    def __init__(self,l='',lazy=False):
         f = l.split('\t')
-        g = f[:8]
-        att = f[8].split(';')
-        attributes = []
-        ID = []
-        for a in att:
-            if len(a) > 3:
-                a = a.strip() # strip whitspace
-                aSplit = a.split(' "') # split key and value
-                aSplit[1] = aSplit[1][:-1] # strip quotes
-                attributes.append('='.join(aSplit))
-                if aSplit[0] in fields:
-                    ID.append(aSplit[1])
-        # put an ID
-        attributes.append('ID=' + '|'.join(ID))
-        g.append(';'.join(attributes)) # g[8]
-        GFFline = '\t'.join(g)
-        Generic.__init__(self,GFFline)
+        try:
+            f[8]
+        except:
+            print '## STRANGE LINE ##', l
+            raise
+        self._seqid = intern(f[0])
+        self._source = intern(f[1])
+        self._type = intern(f[2])
+        self._start = int(f[3]) if f[3] else None
+        self._end = int(f[4]) if f[4] else None
+        self._score = f[5]
+        self._strand = f[6]
+        self._phase = f[7]
+        self._keys, self._values = (), ()
+        self._raw = None
+        if lazy:
+            # decoded on first access
+            self._raw = f[8]
+        else:
+            self._parseAttributes(f[8])
+        self._sortorder = sortorder.get(self._type, 7)
+        # invisible stuff (allocated when needed)
+        self._flagdict = None
+        self._parent = None
+        self._childlist = None
+        # unique numbering
+        self._number = self.instanceCount
+        self.incrementCount()
+
+    def __setstate__(self, state):
+        # unpickled features (eg. from worker processes) share key tables and strings again
+        for k, v in state[1].iteritems():
+            setattr(self, k, v)
+        self._seqid, self._source, self._type = intern(self._seqid), intern(self._source), intern(self._type)
+        self._store(self._keys, self._values)
+
+    def _parseAttributes(self, column):
+        attributes = {}
+        keys = []
+        for a in column.split(';'):
+            if len(a) > 1:
+                e = a.rstrip().split('=')
+                if e[0] not in attributes:
+                    keys.append(e[0])
+                attributes[e[0]] = e[1]
+        self._store(keys, [ attributes[k] for k in keys ])
+        return
+
+    def _store(self, keys, values):
+        self._keys = keytable(keys)
+        self._values = tuple([ intern(v) if type(v) is str else v for v in values ])
+        return
+
+    def _decode(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._parseAttributes(raw)
+        return
+
+    # attributes as dictionary (changes are written back)
+    def _getAttributes(self):
+        self._decode()
+        return AttributeView(self)
+    def _setAttributes(self, attributes):
+        self._raw = None
+        self._store(attributes.keys(), attributes.values())
+    _attributes = property(_getAttributes, _setAttributes)
+
+    # empty flags and childs are not stored
+    def _getFlags(self):
+        return self._flagdict if self._flagdict is not None else {}
+    def _setFlags(self, flags):
+        self._flagdict = flags if flags else None
+    _flags = property(_getFlags, _setFlags)
+
+    def _getChilds(self):
+        return self._childlist if self._childlist is not None else ()
+    def _setChilds(self, childs):
+        self._childlist = childs if childs else None
+    _childs = property(_getChilds, _setChilds)
+
+    ## GETSET (without decoding all attributes)
+    def setAttribute(self,a,warn=False):
+        e = a.split('=')
+        v = intern(e[1])
+        self._decode()
+        try:
+            i = self._keys.index(e[0])
+            self._values = self._values[:i] + (v,) + self._values[i+1:]
+        except ValueError:
+            self._keys = keytable(self._keys + (e[0],))
+            self._values += (v,)
+        if warn and e[0] not in known_attributes:
+            printWarning('unknown attribute (' + e[0] + ')')
+        return
+
+    def hasAttribute(self,a,isSet=True):
+        self._decode()
+        try:
+            v = self._values[self._keys.index(a)]
+        except ValueError:
+            return False
+        return v if isSet else True
+
+    def getAttribute(self,a):
+        self._decode()
+        try:
+            return self._values[self._keys.index(a)]
+        except ValueError:
+            printWarning('attribute (' + a + ') does not exist')
+            raise KeyError(a)
+
+    def setFlag(self,flag):
+        if self._flagdict is None:
+            self._flagdict = {}
+        return GenericBase.setFlag(self, flag)
+
+    def addChild(self,e,check=True):
+        if self._childlist is None:
+            self._childlist = []
+        return GenericBase.addChild(self, e, check)
+
+class GTFFeature(Feature):
+    '''compact GTF feature (see GTF)'''
+    __slots__ = ('_idfields',)
+
+    def __init__(self,l,fields=set(['gene_id']),lazy=False):
+        self._idfields = fields
+        Feature.__init__(self,l,lazy)
+
+    def _parseAttributes(self, column):
+        Feature._parseAttributes(self, gtfAttributes(column, self._idfields))
+
+class AttributeView(dict):
+    '''attribute dictionary of a Feature (item assignment and deletion are written back)'''
+    def __init__(self, feature):
+        dict.__init__(self, itertools.izip(feature._keys, feature._values))
+        self._feature = feature
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self._feature._attributes = self
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self._feature._attributes = self
+
+    def __copy__(self):
+        return dict(self)
 
 class Gene(Generic):
     def __init__(self,f):
@@ -958,8 +1238,9 @@ class Parent(Generic):
                 printWarning('Parent will be built from mixed sources')
             source = a._source
             # determine ambiguous attributes
-            for att in a._attributes.keys():
-                if not attribs.has_key(att) or (attribs.has_key(att) and attribs[att] != a._attributes[att]):
+            attributes = a._attributes
+            for att in attributes.keys():
+                if not attribs.has_key(att) or (attribs.has_key(att) and attribs[att] != attributes[att]):
                     ambiguousAttributes.add(att)
         # remove ambiguous attributes
         for a in ambiguousAttributes:
@@ -1007,3 +1288,434 @@ class Fragment(Generic):
         gf.append('.')
         gf.append('ID=' + str(d) + ';')
         Generic.__init__(self,'\t'.join(gf))
+
+class FeatureIndex(object):
+    '''
+    interval index of features (eg. parse output) per seqid and type
+    starts, ends and subtree maximum ends are int64 arrays sorted per block (implicit augmented
+    interval tree, see dcbio.algo.iitree), coordinates are closed as in Generic.overlap
+    queries take a type or list of types (default all) and return features sorted by start
+    '''
+    def __init__(self, features, types=None):
+        keep = set(types) if types else None
+        self.features = [ e for e in features if e._start is not None and e._end is not None and (keep is None or e._type in keep) ]
+        self.blocks = {}  # seqid -> type -> block
+        codes = []
+        nblocks = 0
+        for e in self.features:
+            try:
+                codes.append(self.blocks[e._seqid][e._type])
+            except KeyError:
+                self.blocks.setdefault(e._seqid, {})[e._type] = nblocks
+                codes.append(nblocks)
+                nblocks += 1
+        codes = np.array(codes, dtype=np.int64)
+        self.order = np.lexsort((np.array([ e._start for e in self.features ], dtype=np.int64), codes))
+        self.starts = np.array([ self.features[i]._start for i in self.order ], dtype=np.int64)
+        self.ends = np.array([ self.features[i]._end for i in self.order ], dtype=np.int64)
+        self.offsets = np.searchsorted(codes[self.order], np.arange(nblocks + 1))
+        self.maxs = np.zeros(len(self.order), dtype=np.int64)
+        self.levels = np.zeros(nblocks, dtype=np.int64)
+        # index of the furthest reaching feature so far (for upstream lookups)
+        self.reach = np.zeros(len(self.order), dtype=np.int64)
+        for c in xrange(nblocks):
+            lo, hi = self.offsets[c], self.offsets[c+1]
+            m, self.levels[c] = iitree.index(self.starts[lo:hi].tolist(), self.ends[lo:hi].tolist())
+            self.maxs[lo:hi] = m
+            ends = self.ends[lo:hi]
+            furthest = ends == np.maximum.accumulate(ends)
+            self.reach[lo:hi] = np.maximum.accumulate(np.where(furthest, np.arange(hi - lo), 0))
+        return
+
+    def __len__(self):
+        return len(self.features)
+
+    def _blocks(self, seqid, types):
+        try:
+            bytype = self.blocks[seqid]
+        except KeyError:
+            return []
+        if types is None:
+            return bytype.values()
+        if isinstance(types, basestring):
+            types = [ types ]
+        return [ bytype[t] for t in types if t in bytype ]
+
+    def _overlap(self, c, start, end):
+        lo, hi = self.offsets[c], self.offsets[c+1]
+        for i in iitree.overlap(self.starts[lo:hi], self.ends[lo:hi], self.maxs[lo:hi], self.levels[c], start, end):
+            yield lo + i
+
+    def _features(self, rows, sort):
+        if sort and len(rows) > 1:
+            rows = np.array(rows)[np.argsort(self.starts[rows], kind='mergesort')]
+        return [ self.features[self.order[r]] for r in rows ]
+
+    def overlap(self, seqid, start, end=None, types=None):
+        '''returns features overlapping start-end (or position start)'''
+        end = start if end is None else end
+        blocks = self._blocks(seqid, types)
+        rows = []
+        for c in blocks:
+            rows.extend(self._overlap(c, start, end))
+        return self._features(rows, len(blocks) > 1)
+
+    def containing(self, seqid, start, end=None, types=None):
+        '''returns features that span start-end (or position start)'''
+        end = start if end is None else end
+        blocks = self._blocks(seqid, types)
+        rows = []
+        for c in blocks:
+            rows.extend(r for r in self._overlap(c, start, end) if self.starts[r] <= start and self.ends[r] >= end)
+        return self._features(rows, len(blocks) > 1)
+
+    def within(self, seqid, start, end, types=None):
+        '''returns features contained in start-end'''
+        blocks = self._blocks(seqid, types)
+        rows = []
+        for c in blocks:
+            lo, hi = self.offsets[c], self.offsets[c+1]
+            i = lo + np.searchsorted(self.starts[lo:hi], start, 'left')
+            j = lo + np.searchsorted(self.starts[lo:hi], end, 'right')
+            rows.extend(i + np.flatnonzero(self.ends[i:j] <= end))
+        return self._features(rows, len(blocks) > 1)
+
+    def nearest(self, seqid, start, end=None, types=None):
+        '''returns overlapping features or else the closest up/downstream (all if equidistant)'''
+        end = start if end is None else end
+        ov = self.overlap(seqid, start, end, types)
+        if ov:
+            return ov
+        blocks = self._blocks(seqid, types)
+        candidates = []
+        for c in blocks:
+            lo, hi = self.offsets[c], self.offsets[c+1]
+            # upstream (features ending furthest among those starting before query, nothing starts in between)
+            i = np.searchsorted(self.starts[lo:hi], start, 'right') - 1
+            if i >= 0:
+                reach = self.ends[lo + self.reach[lo + i]]
+                candidates.extend((start - reach, r) for r in self._overlap(c, reach, reach))
+            # downstream (features with the first start after query)
+            i = lo + np.searchsorted(self.starts[lo:hi], end, 'right')
+            if i < hi:
+                j = lo + np.searchsorted(self.starts[lo:hi], self.starts[i], 'right')
+                candidates.extend((self.starts[i] - end, r) for r in xrange(i, j))
+        if not candidates:
+            return []
+        closest = min(d for d, r in candidates)
+        return self._features([ r for d, r in candidates if d == closest ], True)
+
+## binary store of linked features
+NAMES = ('Name', 'gene_name')  # attributes that name a feature (first found)
+
+def _hierarchy(features):
+    # linked features and all their descendants in hierarchy order (childs with several parents once), row per id
+    rows, seen = [], {}
+    stack = list(reversed(features))
+    while stack:
+        e = stack.pop()
+        if id(e) in seen:
+            continue
+        seen[id(e)] = len(rows)
+        rows.append(e)
+        stack.extend(reversed(e._childs))
+    return rows, seen
+
+def saveStore(features,path,meta={},names=NAMES):
+    '''
+    writes linked features (eg. link output) and all their descendants to a memory-mappable column store
+    rows are in hierarchy order (parents before their childs), childs with several parents are stored once
+    '''
+    rows, seen = _hierarchy(features)
+    # small vocabulary (seqids, sources, types, attribute keys ...) and attribute values
+    vocab, values = {}, {}
+    def code(table, s):
+        s = str(s)
+        try:
+            return table[s]
+        except KeyError:
+            table[s] = len(table)
+            return table[s]
+    columns = dict((c, []) for c in ('seqid', 'source', 'type', 'score', 'strand', 'phase'))
+    starts, ends, parents = [], [], []
+    childOffsets, childRows = [0], []
+    attrOffsets, attrKeys, attrValues = [0], [], []
+    flagOffsets, flagCodes = [0], []
+    ids, labels = [], []
+    for e in rows:
+        for c in columns:
+            columns[c].append(code(vocab, getattr(e, '_' + c)))
+        starts.append(e._start if e._start is not None else -1)
+        ends.append(e._end if e._end is not None else -1)
+        parents.append(seen.get(id(e._parent), -1) if e._parent is not None else -1)
+        childRows.extend(seen[id(c)] for c in e._childs)
+        childOffsets.append(len(childRows))
+        attributes = e._attributes
+        for k, v in attributes.iteritems():
+            attrKeys.append(code(vocab, k))
+            attrValues.append(code(values, v))
+        attrOffsets.append(len(attrKeys))
+        flagCodes.extend(code(vocab, f) for f, v in e._flags.iteritems() if v)
+        flagOffsets.append(len(flagCodes))
+        ids.append(str(attributes.get('ID', '')))
+        labels.append(next((str(attributes[n]) for n in names if n in attributes), ''))
+    arrays = dict((c, np.array(columns[c], dtype=np.int32)) for c in columns)
+    arrays['start'] = np.array(starts, dtype=np.int64)
+    arrays['end'] = np.array(ends, dtype=np.int64)
+    arrays['parent'] = np.array(parents, dtype=np.int64)
+    arrays['childOffsets'] = np.array(childOffsets, dtype=np.int64)
+    arrays['childRows'] = np.array(childRows, dtype=np.int64)
+    arrays['attrOffsets'] = np.array(attrOffsets, dtype=np.int64)
+    arrays['attrKeys'] = np.array(attrKeys, dtype=np.int32)
+    arrays['attrValues'] = np.array(attrValues, dtype=np.int32)
+    arrays['flagOffsets'] = np.array(flagOffsets, dtype=np.int64)
+    arrays['flagCodes'] = np.array(flagCodes, dtype=np.int32)
+    arrays['vocabData'], arrays['vocabOffsets'] = ColumnStore.packStrings(sorted(vocab, key=vocab.get))
+    arrays['valueData'], arrays['valueOffsets'] = ColumnStore.packStrings(sorted(values, key=values.get))
+    arrays['idData'], arrays['idOffsets'] = ColumnStore.packStrings(ids)
+    arrays['idHashes'], arrays['idOrder'] = ColumnStore.hashIndex(ids)
+    arrays['nameData'], arrays['nameOffsets'] = ColumnStore.packStrings(labels)
+    arrays['nameHashes'], arrays['nameOrder'] = ColumnStore.hashIndex(labels)
+    ColumnStore.write(path, arrays, meta)
+    return len(rows)
+
+def cachedGFF(path,ext=None,cache=None,cachedir=None):
+    '''
+    opens parsed and linked annotation through a binary store (cache file, or <cachedir>/<name>.<hash>.gffc)
+    the store is rebuilt whenever the size or mtime of the source file change
+    without cache or cachedir (or if the store cannot be written) the linked features are kept in memory
+    returns a FeatureStore or LinkedFeatures (same lookups)
+    '''
+    if not cache and cachedir:
+        cache = ColumnStore.cachePath(path, cachedir, '.gffc')
+    st = os.stat(path)
+    source = [ os.path.abspath(path), st.st_size, st.st_mtime ]
+    if cache:
+        try:
+            store = FeatureStore(cache)
+            assert store.meta['source'] == source
+            return store
+        except (IOError, OSError, ValueError, KeyError, AssertionError):
+            pass
+    toplevel = link(parse(path, ext or detect(path), compact=True))
+    if cache:
+        try:
+            # replaced atomically (stores that are open keep the old file)
+            saveStore(toplevel, cache, { 'source': source })
+        except (IOError, OSError):
+            printWarning('cannot write annotation store %s' % cache)
+        else:
+            return FeatureStore(cache)
+    return LinkedFeatures(toplevel)
+
+class LinkedFeatures(object):
+    '''linked features in memory with the lookups of a FeatureStore (rows in the same order)'''
+    def __init__(self, features, names=NAMES):
+        self.features = _hierarchy(features)[0]
+        self.ids, self.names = {}, {}
+        for e in self.features:
+            attributes = e._attributes
+            self.ids.setdefault(str(attributes.get('ID', '')), e)
+            label = next((str(attributes[n]) for n in names if n in attributes), '')
+            self.names.setdefault(label, []).append(e)
+        return
+
+    def __len__(self):
+        return len(self.features)
+
+    def __getitem__(self, row):
+        if row < 0 or row >= len(self):
+            raise IndexError(row)
+        return self.features[row]
+
+    def __iter__(self):
+        return iter(self.features)
+
+    def toplevel(self):
+        '''returns features without parent (in stored order)'''
+        return [ e for e in self.features if e._parent is None ]
+
+    def byID(self, ident):
+        '''returns feature with ID'''
+        return self.ids[ident]
+
+    def byName(self, name, types=None):
+        '''returns features named name (see NAMES), optionally of a type or list of types'''
+        found = self.names.get(name, [])
+        if types is None:
+            return list(found)
+        types = set([ types ] if isinstance(types, basestring) else types)
+        return [ e for e in found if e._type in types ]
+
+class FeatureStore(object):
+    '''
+    linked features of a binary store (see saveStore), memory-mapped
+    features are read-only views (FeatureView) that decode their fields on access
+    '''
+    def __init__(self, path):
+        arrays, self.meta = ColumnStore.load(path)
+        for k, v in arrays.iteritems():
+            setattr(self, k, v)
+        self.vocab = list(ColumnStore.Strings(arrays['vocabData'], arrays['vocabOffsets']))
+        self.vocabCodes = dict((s, i) for i, s in enumerate(self.vocab))
+        self.values = ColumnStore.Strings(arrays['valueData'], arrays['valueOffsets'])
+        self.ids = ColumnStore.Strings(arrays['idData'], arrays['idOffsets'])
+        self.names = ColumnStore.Strings(arrays['nameData'], arrays['nameOffsets'])
+        return
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, row):
+        if row < 0 or row >= len(self):
+            raise IndexError(row)
+        return FeatureView(self, int(row))
+
+    def __iter__(self):
+        for row in xrange(len(self)):
+            yield FeatureView(self, row)
+
+    def toplevel(self):
+        '''returns features without parent (in stored order)'''
+        return [ FeatureView(self, int(row)) for row in np.flatnonzero(self.parent < 0) ]
+
+    def byID(self, ident):
+        '''returns feature with ID'''
+        rows = ColumnStore.hashLookup(self.ids, self.idHashes, self.idOrder, ident)
+        if not rows:
+            raise KeyError(ident)
+        return FeatureView(self, rows[0])
+
+    def byName(self, name, types=None):
+        '''returns features named name (see NAMES), optionally of a type or list of types'''
+        found = [ FeatureView(self, row) for row in ColumnStore.hashLookup(self.names, self.nameHashes, self.nameOrder, name) ]
+        if types is None:
+            return found
+        types = set([ types ] if isinstance(types, basestring) else types)
+        return [ e for e in found if e._type in types ]
+
+def _vocabColumn(column):
+    # property decoding a vocabulary column of FeatureView
+    return property(lambda self: self._store.vocab[getattr(self._store, column)[self._number]])
+
+def _readOnly(name):
+    # mutator of FeatureView
+    def method(self, *args, **kwargs):
+        raise TypeError('%s: features of a FeatureStore are read-only' % name)
+    method.__name__ = name
+    return method
+
+class FrozenDict(dict):
+    '''dictionary that cannot be changed (attributes and flags of a FeatureView), copies are plain dictionaries'''
+    def _frozen(self, *args, **kwargs):
+        raise TypeError('attributes and flags of a FeatureView are read-only')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _frozen
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+class FeatureView(GenericBase):
+    '''read-only feature of a FeatureStore (_number is the row)'''
+    __slots__ = ('_store', '_number')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._number = row
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureView) and other._store is self._store and other._number == self._number
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._store), self._number))
+
+    _seqid = _vocabColumn('seqid')
+    _source = _vocabColumn('source')
+    _type = _vocabColumn('type')
+    _score = _vocabColumn('score')
+    _strand = _vocabColumn('strand')
+    _phase = _vocabColumn('phase')
+
+    @property
+    def _start(self):
+        x = int(self._store.start[self._number])
+        return x if x >= 0 else None
+
+    @property
+    def _end(self):
+        x = int(self._store.end[self._number])
+        return x if x >= 0 else None
+
+    @property
+    def _sortorder(self):
+        return sortorder.get(self._type, 7)
+
+    @property
+    def _attributes(self):
+        s = self._store
+        lo, hi = s.attrOffsets[self._number], s.attrOffsets[self._number+1]
+        return FrozenDict((s.vocab[k], s.values[v]) for k, v in itertools.izip(s.attrKeys[lo:hi].tolist(), s.attrValues[lo:hi].tolist()))
+
+    @property
+    def _flags(self):
+        s = self._store
+        return FrozenDict((s.vocab[c], True) for c in s.flagCodes[s.flagOffsets[self._number]:s.flagOffsets[self._number+1]].tolist())
+
+    @property
+    def _parent(self):
+        p = self._store.parent[self._number]
+        return FeatureView(self._store, int(p)) if p >= 0 else None
+
+    @property
+    def _childs(self):
+        s = self._store
+        return [ FeatureView(s, r) for r in s.childRows[s.childOffsets[self._number]:s.childOffsets[self._number+1]].tolist() ]
+
+    ## GETSET (single attribute without decoding all)
+    def _value(self, a):
+        s = self._store
+        lo, hi = s.attrOffsets[self._number], s.attrOffsets[self._number+1]
+        try:
+            i = s.attrKeys[lo:hi].tolist().index(s.vocabCodes[a])
+        except (KeyError, ValueError):
+            raise KeyError(a)
+        return s.values[int(s.attrValues[lo + i])]
+
+    def hasAttribute(self,a,isSet=True):
+        try:
+            v = self._value(a)
+        except KeyError:
+            return False
+        return v if isSet else True
+
+    def getAttribute(self,a):
+        try:
+            return self._value(a)
+        except KeyError:
+            printWarning('attribute (' + a + ') does not exist')
+            raise
+
+    # no changes (the store is memory-mapped read-only)
+    setUniqueIdent = _readOnly('setUniqueIdent')
+    setAttribute = _readOnly('setAttribute')
+    removeAttributesBut = _readOnly('removeAttributesBut')
+    offset = _readOnly('offset')
+    setFlag = _readOnly('setFlag')
+    unsetFlag = _readOnly('unsetFlag')
+    setStrand = _readOnly('setStrand')
+    setParent = _readOnly('setParent')
+    addChild = _readOnly('addChild')
+    extend = _readOnly('extend')
+    addSubId = _readOnly('addSubId')
+    flattenChilds = _readOnly('flattenChilds')
+
+
+if __name__ == "__main__":
+    # compact features are fully slotted (no instance dictionary)
+    for f in (Feature('chr1\ttest\texon\t11\t20\t.\t+\t.\tID=e1;Parent=t1'),
+              GTFFeature('chr1\ttest\texon\t11\t20\t.\t+\t.\tgene_id "g1"; transcript_id "t1";')):
+        assert not hasattr(f, '__dict__'), '%s has an instance dictionary' % type(f).__name__
+        print repr(f)
+    assert not hasattr(object.__new__(FeatureView), '__dict__'), 'FeatureView has an instance dictionary'
@@ -13,25 +13,24 @@ __email__ = "david.brawand@dpag.ox.ac.uk"
 __status__ = "Development"  # ["Prototype", "Development",  "Production"]
 
 import sys
+import itertools
+import functools
+import multiprocessing
+from collections import Counter
 from optparse import OptionParser
-import dcbio.parse.BEDfile
+import dcbio.parse.BEDfile as BEDfile
 
-def ovp(a,b):
-    return max(0, min(a[1], b[1]) - max(a[0], b[0]))
+def spliceoverlap(a,b):
+    '''number of block pairs with equal starts plus pairs with equal ends (zero-length blocks included)'''
+    starts, ends = Counter([ x[0] for x in b ]), Counter([ x[1] for x in b ])
+    return sum([ starts[x[0]] + ends[x[1]] for x in a ])
 
 def movp(a,b):
     '''overlapping function returns overhang (non-overlapping length)'''
-    alen, blen = sum([abs(x[1]-x[0]) for x in a]), sum([abs(x[1]-x[0]) for x in b])
-    overlap = 0
-    spliceoverlap = 0
-    for x in a:
-        for y in b:
-            overlap += ovp(x,y)
-            if x[0] == y[0]:
-                spliceoverlap += 1
-            if x[1] == y[1]:
-                spliceoverlap += 1
-    return (alen-overlap, blen-overlap), (len(a)*2-spliceoverlap, len(b)*2-spliceoverlap)
+    overlap = sum([ x[1]-x[0] for x in BEDfile.sweep([a, b])[0] ])
+    alen, blen = sum([ x[1]-x[0] for x in a ]), sum([ x[1]-x[0] for x in b ])
+    shared = spliceoverlap(a, b)
+    return (alen-overlap, blen-overlap), (len(a)*2-shared, len(b)*2-shared)
 
 def merge(iv):
     saved = list(iv[0])
@@ -45,124 +44,179 @@ def merge(iv):
     yield tuple(saved)
 
 
+def subsets(o):
+    '''block subsets of secondary transcript (computed once)'''
+    try:
+        return o.meta['blocks']
+    except KeyError:
+        o.meta['blocks'] = o.blockSubsets()
+        return o.meta['blocks']
+
+def candidates(b, two, index, overlaps=None):
+    '''secondary transcripts overlapping b (from overlap file or interval index), None if there are none'''
+    if overlaps is not None:
+        if b.name not in overlaps:
+            return None
+        return [ two[o] for o in overlaps[b.name] ]
+    # same strand and at least one shared base
+    found = [ o for o in index.query(b.chrom, b.chromStart, b.chromEnd) \
+        if o.strand == b.strand and o.chromStart < b.chromEnd and o.chromEnd > b.chromStart ]
+    return sorted(found, key=lambda x: (x.chromStart, x.chromEnd, x.name)) or None
+
+def extend(line, two, index, overlaps=None):
+    '''
+    extends 3'UTR of primary transcript, returns output and statistics line
+    two and index are the secondary transcripts by name and their interval index, overlaps the optional overlap file
+    '''
+    if line[0] == "#" or line.startswith('track') or not line.strip():
+        return None
+    b = BEDfile.BEDline(line)
+    out, log = [], []
+    # split in blocks and mark stop codon
+    stopcodon1 = int(b.thickEnd) if b.strand == '+' else int(b.thickStart)
+    b.meta['blocks'] = b.blockSubsets()
+    # statistics
+    originalLength = len(b)
+    log.append('\t'.join(map(str,[b.chrom, b.chromStart, b.chromEnd, b.name])) + '\t')
+    if b.strand == '+':
+        log.append(str(sum([x[1]-x[0] for x in b.meta['blocks'][2]])) + '\t')
+    elif b.strand == '-':
+        log.append(str(sum([x[1]-x[0] for x in b.meta['blocks'][0]])) + '\t')
+    else:
+        raise Exception('Unkown strand')
+    # get overlaps for all candidates (return mismatches, so 0 is the optimal case)
+    found = candidates(b, two, index, overlaps)
+    if found is None:
+        b.name += '|NO'
+        out.append(str(b) + '\n')
+    else:
+        # get overlap metrics
+        stats = {}
+        for o in found:
+            # check strand compatibility
+            try:
+                assert o.strand == b.strand
+            except:
+                raise Exception('Strands of overlapping features are not equal')
+
+            blocks = subsets(o)
+            # check if stop codon the same
+            stopcodon2 = int(o.thickEnd) if o.strand == '+' else int(o.thickStart)
+            stopdiff = abs(stopcodon1-stopcodon2)
+            # check CDS and splice
+            over, splice = movp(b.meta['blocks'][1],blocks[1])
+            # aggregate stats for the 3'UTR (strand dependent)
+            if b.strand == '-':
+                left_utrover, left_utrsplice = movp(b.meta['blocks'][0],blocks[0])
+                stats[id(o)] = (stopdiff,splice,over,left_utrover,left_utrsplice)
+            elif b.strand == '+':
+                rite_utrover, rite_utrsplice = movp(b.meta['blocks'][2],blocks[2])
+                stats[id(o)] = (stopdiff,splice,over,rite_utrover,rite_utrsplice)
+            else:
+                raise Exception('Unkown strand')
+        # print results
+        for o in sorted(found, key=lambda x: stats[id(x)][:3]):  # sort by first 3 statistics
+            s = stats[id(o)]
+            if s[0] == 0 and \
+                s[1][0] == 0 and \
+                s[2][0] == 0 and \
+                s[3][0] == 0 and \
+                s[4][1] > 0:  # check if 1. STOP codon 2. CDS splice/seq of a subset of refseq 3.  3'UTR is extended
+
+                # merge 3'UTR blocks
+                if b.strand == '-':
+                    b.meta['blocks'][0] = subsets(o)[0]
+                elif b.strand == '+':
+                    b.meta['blocks'][2] = subsets(o)[2]
+                else:
+                    raise Exception('Unkown strand')
+
+                # rebuild everything from blocks
+                b.thickStart = min([ x[0] for x in b.meta['blocks'][1] ])
+                b.thickEnd = max([ x[1] for x in b.meta['blocks'][1] ])
+                b.chromStart = min([ x[0] for x in b.meta['blocks'][0] ] + [ b.thickStart ])
+                b.chromEnd = max([ b.thickEnd ] + [ x[1] for x in b.meta['blocks'][2] ])
+                offsets,lengths = [],[]
+                for exon in merge(b.meta['blocks'][0] + b.meta['blocks'][1] + b.meta['blocks'][2]):
+                    offsets.append(exon[0]-b.chromStart)
+                    lengths.append(exon[1]-exon[0])
+                b.blockCount = len(offsets)
+                b.blockSizes = ','.join(map(str,lengths))
+                b.blockStarts = ','.join(map(str,offsets))
+
+                # finalize
+                b.name += '|' + o.name
+            else:
+                # no extension possible
+                b.name += '|NA'
+            out.append(str(b) + '\n')
+            break  # only print first match-extensions
+    if b.strand == '+':
+        log.append(str(sum([x[1]-x[0] for x in b.meta['blocks'][2]])) + '\t')
+    elif b.strand == '-':
+        log.append(str(sum([x[1]-x[0] for x in b.meta['blocks'][0]])) + '\t')
+    else:
+        raise Exception('Unkown strand')
+    log.append(str(len(b)-originalLength) +'\n')
+    return ''.join(out), ''.join(log)
+
+# secondary annotation of pool workers (set by the pool initializer)
+_secondary = None
+
+def _initWorker(two, index, overlaps):
+    global _secondary
+    _secondary = (two, index, overlaps)
+    return
+
+def _extend(line):
+    return extend(line, *_secondary)
+
+
 if __name__=="__main__":
 
     parser = OptionParser()
     parser.add_option("-1", "--primary", dest="primary", metavar="FILE", help="Primary annotation")
     parser.add_option("-2", "--secondary", dest="secondary", metavar="FILE", help="Secondary annotation (extends first)")
-    parser.add_option("-o", "--overlaps", dest="overlaps", metavar="FILE", help="Overlapping IDs (eg from bedIntersect)")
+    parser.add_option("-o", "--overlaps", dest="overlaps", metavar="FILE", help="Overlapping IDs (eg from bedIntersect) [default: overlaps on same strand]")
+    parser.add_option("-p", "--processes", dest="processes", type="int", default=1, metavar="N", help="Parallel processes [%default]")
 
     (options, args) = parser.parse_args()
 
-
-    # read BED12 files
-    with open(options.primary) as fh:
-        one = BEDfile.BED(fh)
-
-    # read second and index
+    # read second and index (shared with forked workers)
     with open(options.secondary) as fh:
-        two = BEDfile.BED(fh)
-        two = two.getDict('name')
-
-    # read overlaps
-    overlaps = {}
-    with open(options.overlaps) as fh:
-        for line in fh:
-            f = line.split()
-            try:
-                overlaps[f[0]].append(f[1])
-            except:
-                overlaps[f[0]] = [f[1]]
+        second = BEDfile.BED(fh)
+        two = second.getDict('name')
+        index = second.getIndex()
+
+    # read overlaps (otherwise from index)
+    overlaps = None
+    if options.overlaps:
+        overlaps = {}
+        with open(options.overlaps) as fh:
+            for line in fh:
+                f = line.split()
+                try:
+                    overlaps[f[0]].append(f[1])
+                except:
+                    overlaps[f[0]] = [f[1]]
 
     # overlap each and decide on best overlap
     # attach UTR
     # report what has been merged
-    for b in one:
-        # split in blocks and mark stop codon
-        stopcodon1 = int(b.thickEnd) if b.strand == '+' else int(b.thickStart)
-        b.meta['blocks'] = b.blockSubsets()
-        # statistics
-        originalLength = len(b)
-        sys.stderr.write('\t'.join(map(str,[b.chrom, b.chromStart, b.chromEnd, b.name])) + '\t')
-        if b.strand == '+':
-            sys.stderr.write(str(sum([x[1]-x[0] for x in b.meta['blocks'][2]])) + '\t')
-        elif b.strand == '-':
-            sys.stderr.write(str(sum([x[1]-x[0] for x in b.meta['blocks'][0]])) + '\t')
-        else:
-            raise Exception('Unkown strand')
-        # get overlaps for all candidates (return mismatches, so 0 is the optimal case)
-        stats = []
-        try:
-            overlaps[b.name]
-        except KeyError:
-            b.name += '|NO'
-            print b
-        else:
-            # get overlap metrics
-            for o in overlaps[b.name]:
-                # check strand compatibility
-                try:
-                    assert two[o].strand == b.strand
-                except:
-                    raise Exception('Strands of overlapping features are not equal')
-
-                two[o].meta['blocks'] = two[o].blockSubsets()
-                # check if stop codon the same
-                stopcodon2 = int(two[o].thickEnd) if two[o].strand == '+' else int(two[o].thickStart)
-                stopdiff = abs(stopcodon1-stopcodon2)
-                # check CDS and splice
-                over, splice = movp(b.meta['blocks'][1],two[o].meta['blocks'][1])
-                # aggregate stats for the 3'UTR (strand dependent)
-                if b.strand == '-':
-                    left_utrover, left_utrsplice = movp(b.meta['blocks'][0],two[o].meta['blocks'][0])
-                    two[o].meta['stats'] = (stopdiff,splice,over,left_utrover,left_utrsplice)
-                elif b.strand == '+':
-                    rite_utrover, rite_utrsplice = movp(b.meta['blocks'][2],two[o].meta['blocks'][2])
-                    two[o].meta['stats'] = (stopdiff,splice,over,rite_utrover,rite_utrsplice)
-                else:
-                    raise Exception('Unkown strand')
-            # print results
-            for o in sorted(overlaps[b.name], key=lambda x: two[x].meta['stats'][:3]):  # sort by first 3 statistics
-                s = two[o].meta['stats']
-                if s[0] == 0 and \
-                    s[1][0] == 0 and \
-                    s[2][0] == 0 and \
-                    s[3][0] == 0 and \
-                    s[4][1] > 0:  # check if 1. STOP codon 2. CDS splice/seq of a subset of refseq 3.  3'UTR is extended
-
-                    # merge 3'UTR blocks
-                    if b.strand == '-':
-                        b.meta['blocks'][0] = two[o].meta['blocks'][0]
-                    elif b.strand == '+':
-                        b.meta['blocks'][2] = two[o].meta['blocks'][2]
-                    else:
-                        raise Exception('Unkown strand')
-
-                    # rebuild everything from blocks
-                    b.thickStart = min([ x[0] for x in b.meta['blocks'][1] ])
-                    b.thickEnd = max([ x[1] for x in b.meta['blocks'][1] ])
-                    b.chromStart = min([ x[0] for x in b.meta['blocks'][0] ] + [ b.thickStart ])
-                    b.chromEnd = max([ b.thickEnd ] + [ x[1] for x in b.meta['blocks'][2] ])
-                    offsets,lengths = [],[]
-                    for exon in merge(b.meta['blocks'][0] + b.meta['blocks'][1] + b.meta['blocks'][2]):
-                        offsets.append(exon[0]-b.chromStart)
-                        lengths.append(exon[1]-exon[0])
-                    b.blockCount = len(offsets)
-                    b.blockSizes = ','.join(map(str,lengths))
-                    b.blockStarts = ','.join(map(str,offsets))
-
-                    # finalize
-                    b.name += '|' + o
-                else:
-                    # no extension possible
-                    b.name += '|NA'
-                print b
-                break  # only print first match-extensions
-        if b.strand == '+':
-            sys.stderr.write(str(sum([x[1]-x[0] for x in b.meta['blocks'][2]])) + '\t')
-        elif b.strand == '-':
-            sys.stderr.write(str(sum([x[1]-x[0] for x in b.meta['blocks'][0]])) + '\t')
-        else:
-            raise Exception('Unkown strand')
-        sys.stderr.write(str(len(b)-originalLength) +'\n')
-
+    # stream primary BED12 file (file order, constant memory)
+    primaryfh = open(options.primary)
+    if options.processes > 1:
+        pool = multiprocessing.Pool(options.processes, _initWorker, (two, index, overlaps))
+        results = pool.imap(_extend, primaryfh, 64)
+    else:
+        pool = None
+        results = itertools.imap(functools.partial(extend, two=two, index=index, overlaps=overlaps), primaryfh)
+    for r in results:
+        if r:
+            sys.stdout.write(r[0])
+            sys.stderr.write(r[1])
+    if pool:
+        pool.close()
+        pool.join()
+
+    primaryfh.close()
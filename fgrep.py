@@ -2,16 +2,20 @@
 
 '''
 similar to grep -f but requires a specified field (default is first)
+- exact matching of entire fields (-m) is a hash join, multiple columns match against multi-column terms
+- substring matching uses an Aho-Corasick automaton (all terms at once)
 '''
 
 import sys
 from optparse import OptionParser
 
+from dcbio.algo.matcher import Matcher
+
 # read options
 parser = OptionParser()
 parser.add_option("-v", action="store_true",dest="negate",default=False, help="Negate (like \'grep -v\')")
 parser.add_option("-f", dest='termfile',help="search term file [MANDATORY]")
-parser.add_option("-c", dest='column',default='1', help="column number [1]")
+parser.add_option("-c", dest='column',default='1', help="column number(s), comma separated (0 for all) [1]")
 parser.add_option("-d", dest='delim',default='\t', help="delimier [tab]")
 parser.add_option("-m", action="store_true",dest='fullmatch',default=False, help="match entire field [DEFAULT: False]")
 (options, args) = parser.parse_args()
@@ -31,10 +35,19 @@ elif options.termfile == '-':
 else:
     fh = open(options.termfile,'r')
 
+# columns (multiple columns are matched as key against the same number of term columns)
+columns = [ int(c)-1 for c in options.column.split(',') ]
+if -1 in columns:
+    columns = None
+width = len(columns) if columns and options.fullmatch else 1
+
 # read terms
 terms = set([])
 for line in fh:
-    terms.add(line.split()[0])
+    f = line.split()
+    if len(f) < width:
+        continue
+    terms.add(tuple(f[:width]) if width > 1 else f[0])
 fh.close()
 
 print >> sys.stderr, len(terms), "search terms read"
@@ -46,34 +59,10 @@ else:
     fh = open(args[0],'r')
 
 # parse file
-column = int(options.column)-1
-foundterms = set([])
-for line in fh:
-    f = line.rstrip().split(options.delim)
-    found = False
-    if column >= 0:
-        to = column + 1
-        searchthis = f[column:to]
-    else:
-        searchthis = f
-    if options.fullmatch:
-        for i in searchthis:
-            if i in terms:
-                found = True
-                foundterms.add(i)
-                break
-    else:
-        for t in terms:
-            if any([ t in x for x in searchthis]):
-                found = True
-                foundterms.add(t)
-                break
-    # XOR
-    if found != options.negate:
-        sys.stdout.write(line)
+matcher = Matcher(terms, columns, options.delim, not options.fullmatch)
+sys.stdout.writelines(matcher.filter(fh, options.negate))
 
 if options.fullmatch:
     print >> sys.stderr, "\nMissed terms:\n-------------"
-    for t in list(terms.difference(foundterms)):
-       print >> sys.stderr, t
-
+    for t in list(terms.difference(matcher.found)):
+       print >> sys.stderr, t if width == 1 else '\t'.join(t)
@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
 '''
-substitutes chromosome names according to list
+substitutes chromosome names according to list and/or prebuilt assembly aliases
+- BED/GTF/VCF: first column and ##contig headers
+- SAM: RNAME, RNEXT and @SQ headers (detected from header or -s)
+lines on unlinked chromosomes are skipped (kept unchanged with -k or assembly aliases)
 '''
 
 import sys
+from optparse import OptionParser
+
+from dcbio.misc import ChromAlias
 
 def readlinks(fi):
     links = {}
@@ -15,19 +21,34 @@ def readlinks(fi):
     return links
 
 if __name__=="__main__":
-    skipped = {}
-    li = readlinks(sys.argv[1])
-    for line in sys.stdin:
-        f = line.split('\t')
-        try:
-            sys.stdout.write('\t'.join([li[f[0]]] + f[1:]))
-        except KeyError:
-            try:
-                skipped[f[0]] += 1
-            except:
-                skipped[f[0]] = 1
-                print >> sys.stderr, "WARNING: unlinked chromosome %s (skipped)" % (f[0])
-
-    print >> sys.stderr, "Skipped BED lines:"
-    for k in sorted(skipped.keys()):
-        print >> sys.stderr, '\t' + k + '\t' + str(skipped[k])
+    parser = OptionParser(usage="%prog [options] [linkfile] < IN > OUT")
+    parser.add_option("-a", "--assembly", dest="assembly", metavar="NAME", help="Use aliases of assembly (%s)" % ','.join(sorted(ChromAlias.ASSEMBLIES.keys())))
+    parser.add_option("-t", "--to", dest="style", default="ucsc", metavar="STYLE", help="Naming of aliases (%s) [%%default]" % ','.join(ChromAlias.STYLES))
+    parser.add_option("-s", "--sam", dest="sam", action="store_true", default=False, help="Input is SAM (default if first line is a SAM header)")
+    parser.add_option("-k", "--keep", dest="keep", action="store_true", default=None, help="Keep lines on unlinked chromosomes unchanged (default with -a, aliases cover the assembled chromosomes only)")
+    parser.add_option("-d", "--drop", dest="keep", action="store_false", help="Skip lines on unlinked chromosomes (default with a link file only)")
+    (options, args) = parser.parse_args()
+
+    li = {}
+    if options.assembly:
+        li.update(ChromAlias.aliases(options.assembly, options.style))
+    if args:
+        li.update(readlinks(args[0]))
+    if not li:
+        parser.error('Need a link file and/or an assembly')
+
+    keep = bool(options.assembly) if options.keep is None else options.keep
+    renamer = ChromAlias.Renamer(li, options.sam, keep)
+    first = True
+    while True:
+        lines = sys.stdin.readlines(1 << 24)
+        if not lines:
+            break
+        if first:
+            renamer.sam |= lines[0].startswith('@HD') or lines[0].startswith('@SQ')
+            first = False
+        sys.stdout.write(renamer.chunk(lines))
+
+    print >> sys.stderr, "Unlinked lines (%s):" % ('kept' if keep else 'skipped')
+    for k in sorted(renamer.skipped.keys()):
+        print >> sys.stderr, '\t' + k + '\t' + str(renamer.skipped[k])